@@ -1,19 +1,53 @@
 # app.py
+import time
+_t_import = time.perf_counter()
 from flask import Flask, render_template
-from flask_migrate import Migrate
 from flask_login import LoginManager, current_user  # <-- add current_user
-from config import Dev
-from models import db, User
+import os
+from config import CONFIGS
+from models import db
+from services import startup
+IMPORT_SECONDS = time.perf_counter() - _t_import
 
 login = LoginManager()
 login.login_view = "auth.login"
 
-def create_app():
+def create_app(config=None):
+    t0 = time.perf_counter()
     app = Flask(__name__)
-    app.config.from_object(Dev)
+    app.config.from_object(CONFIGS[config or os.getenv("APP_CONFIG", "dev")])
+    startup.use_bytecode_cache(app)
 
     db.init_app(app)
-    Migrate(app, db)
+    from services import database
+    database.init_app(app, db)
+    # alembic is most of our import time; fast-start workers only need it for `flask db ...`
+    if not app.config.get("FAST_START") or startup.from_cli():
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    from services import render_cache, annotation_cache, anchor_index
+    render_cache.configure(app.config)
+    annotation_cache.configure(app.config)
+    anchor_index.configure(app.config)
+
+    from services import search
+    search.init_app(app)
+
+    from services import purge
+    purge.init_app(app)
+
+    from services import render_pool
+    render_pool.init_app(app)
+
+    from services import metrics
+    metrics.init_app(app)
+
+    from services import identity
+    identity.init_app(app)
+
+    from services import events
+    events.init_app(app)
 
     # Initialize Flask-Login
     login.init_app(app)
@@ -25,46 +59,54 @@ def create_app():
 
     @login.user_loader
     def load_user(uid):
-        return User.query.get(int(uid))
+        return identity.load(int(uid))
 
+    t_blueprints = time.perf_counter()
     from blueprints.auth_bp import auth_bp
     from blueprints.documents_bp import docs_bp
     from blueprints.annotations_bp import ann_bp
     from blueprints.sharing_bp import share_bp
+    from blueprints.search_bp import search_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(docs_bp)
     app.register_blueprint(ann_bp)
     app.register_blueprint(share_bp)
+    app.register_blueprint(search_bp)
+    t_blueprints = time.perf_counter() - t_blueprints
 
     # app.py (replace your index() route)
-    from sqlalchemy import or_
+    from flask import request, jsonify, url_for
     from flask_login import current_user
-    from models import Document, DocumentShare
+    from services.doc_index import page_documents
+    from services.permissions import roles_for
+    from services.database import read_only
+
+    def _index_page():
+        user = current_user if getattr(current_user, "is_authenticated", False) else None
+        # logged-out visitors page through public docs only
+        docs, next_cursor = page_documents(user, request.args.get("cursor"),
+                                           request.args.get("limit", type=int))
+        return docs, next_cursor, roles_for(docs, user)
 
     @app.get("/")
+    @read_only
     def index():
-        if getattr(current_user, "is_authenticated", False):
-            docs = (
-                Document.query
-                .outerjoin(DocumentShare, Document.id == DocumentShare.document_id)
-                .filter(
-                    or_(
-                        Document.owner_id == current_user.id,
-                        DocumentShare.user_id == current_user.id
-                    )
-                )
-                .order_by(Document.updated_at.desc())
-                .distinct()
-                .all()
-            )
-        else:
-            # show public docs to logged-out visitors
-            docs = (Document.query
-                    .filter_by(is_public=True)
-                    .order_by(Document.updated_at.desc())
-                    .all())
-        return render_template("index.html", docs=docs)
+        docs, next_cursor, roles = _index_page()
+        return render_template("index.html", docs=docs, roles=roles, next_cursor=next_cursor)
 
+    @app.get("/api/documents")
+    @read_only
+    def index_page():
+        docs, next_cursor, roles = _index_page()
+        return jsonify({
+            "items": [{"id": d.id, "title": d.title, "is_public": bool(d.is_public),
+                       "role": roles.get(d.id), "updated_at": d.updated_at.isoformat(),
+                       "url": url_for("docs.view_doc", doc_id=d.id)} for d in docs],
+            "html": render_template("_doc_cards.html", docs=docs, roles=roles),
+            "next_cursor": next_cursor,
+        })
 
+    startup.install_report(app, {"imports": IMPORT_SECONDS, "create_app": time.perf_counter() - t0,
+                                 "blueprints": t_blueprints})
     return app
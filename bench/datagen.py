@@ -0,0 +1,141 @@
+import datetime as dt
+import random
+import secrets
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+from models import (db, User, Document, DocumentVersion, DocumentShare, Annotation, AnnotationComment,
+                    ROLE_VIEWER, ROLE_ANNOTATOR, ROLE_EDITOR)
+from services import search, version_store
+from services.markdown_render import render_document
+
+# Synthetic dataset for the benchmarks. Everything is drawn from one seeded
+# Random, so the same arguments always produce the same rows.
+PASSWORD = "bench-pass"
+SCALES = {
+    "tiny": dict(users=10, docs=20, versions=2, annotations=20, comments=1, paragraphs=12),
+    "small": dict(users=50, docs=200, versions=3, annotations=50, comments=2, paragraphs=30),
+    "medium": dict(users=500, docs=2000, versions=5, annotations=200, comments=2, paragraphs=60),
+    "large": dict(users=2000, docs=10000, versions=8, annotations=500, comments=3, paragraphs=120),
+}
+ROLES = [ROLE_VIEWER] * 6 + [ROLE_ANNOTATOR] * 3 + [ROLE_EDITOR]
+WORDS = ("integral derivative manifold tensor vector field operator kernel spectrum basis norm "
+         "lemma theorem proof corollary bound estimate series limit measure space metric flow "
+         "energy action symmetry group orbit invariant boundary domain solution equation the of "
+         "and a to in is that for with as on by this we which be are it from").split()
+COLORS = ["yellow", "#ffeb3b", "#a5d6a7", "#90caf9", "#f48fb1"]
+
+def _sentence(rnd):
+    words = rnd.choices(WORDS, k=rnd.randint(8, 24))
+    if rnd.random() < 0.15:
+        words.insert(rnd.randrange(len(words)), f"$x_{rnd.randint(1, 9)}^2 + y$")
+    return " ".join(words).capitalize() + "."
+
+def _block(rnd):
+    r = rnd.random()
+    if r < 0.12:
+        return "#" * rnd.choice((1, 2, 2, 3)) + " " + " ".join(rnd.choices(WORDS, k=3)).title()
+    if r < 0.2:
+        return "\n".join("- " + _sentence(rnd) for _ in range(rnd.randint(2, 5)))
+    if r < 0.24:
+        return "```\n" + "\n".join(f"x{i} = f(x{i - 1})" for i in range(1, rnd.randint(3, 8))) + "\n```"
+    if r < 0.28:
+        return "$$\\int_0^{%d} f(x)\\,dx = %d$$" % (rnd.randint(1, 9), rnd.randint(1, 99))
+    return " ".join(_sentence(rnd) for _ in range(rnd.randint(2, 6)))
+
+def _edit(rnd, blocks):
+    # a typical save: touch a few blocks, append a little
+    blocks = list(blocks)
+    for _ in range(rnd.randint(1, max(1, len(blocks) // 10))):
+        i = rnd.randrange(len(blocks))
+        op = rnd.random()
+        if op < 0.5:
+            blocks[i] = _block(rnd)
+        elif op < 0.8:
+            blocks.insert(i, _block(rnd))
+        elif len(blocks) > 1:
+            del blocks[i]
+    blocks.extend(_block(rnd) for _ in range(rnd.randint(0, 3)))
+    return blocks
+
+def _share_targets(rnd, user_ids, owner_id):
+    # popularity is skewed: a few users are shared into most documents
+    k = min(len(user_ids) - 1, int(rnd.paretovariate(1.5)) - 1)
+    picked = set()
+    while len(picked) < k:
+        uid = user_ids[min(len(user_ids) - 1, int(rnd.expovariate(6 / len(user_ids))))]
+        if uid != owner_id:
+            picked.add(uid)
+    return picked
+
+def generate(users=50, docs=200, versions=3, annotations=50, comments=2, paragraphs=30,
+             public_ratio=0.2, seed=1234, log=print):
+    """Fill the current app's database. Returns row counts per table.
+
+    ``annotations`` and ``comments`` are averages (per latest version / per
+    annotation, the first comment being the note); shares follow a skewed
+    popularity so a few users see many documents.
+    """
+    rnd = random.Random(seed)
+    pw_hash = generate_password_hash(PASSWORD)  # hashing per user would dominate the run
+    base = dt.datetime(2024, 1, 1)
+    db.session.execute(insert(User), [{"username": f"user{i:05d}", "password_hash": pw_hash,
+                                       "created_at": base} for i in range(users)])
+    user_ids = list(db.session.scalars(select(User.id).order_by(User.id)))
+    counts = {"users": users, "documents": 0, "versions": 0, "shares": 0, "annotations": 0, "comments": 0}
+
+    for n in range(docs):
+        owner = user_ids[min(users - 1, int(rnd.expovariate(4 / users)))]
+        updated = base + dt.timedelta(minutes=rnd.randint(0, 60 * 24 * 365))
+        doc = Document(title=" ".join(rnd.choices(WORDS, k=rnd.randint(2, 6))).title(), owner_id=owner,
+                       is_public=rnd.random() < public_ratio, share_token=secrets.token_hex(16),
+                       created_at=base, updated_at=updated)
+        blocks = [_block(rnd) for _ in range(paragraphs)]
+        prev = None
+        for number in range(1, rnd.randint(1, versions) + 1):
+            if prev is not None:
+                blocks = _edit(rnd, blocks)
+            md = "\n\n".join(blocks)
+            html, plain, sections = render_document(md)
+            v = DocumentVersion(document=doc, number=number, source_md=md, rendered_html=html,
+                                rendered_plain=plain, sections=sections, created_at=updated)
+            db.session.add(v)
+            if prev is not None:
+                db.session.flush()
+                version_store.compact(prev, v)
+            prev = v
+            counts["versions"] += 1
+        db.session.flush()
+
+        shares = _share_targets(rnd, user_ids, owner)
+        if shares:
+            db.session.execute(insert(DocumentShare), [{"document_id": doc.id, "user_id": uid,
+                                                        "role": rnd.choice(ROLES)} for uid in shares])
+        counts["shares"] += len(shares)
+
+        plain = prev.rendered_plain
+        authors = [owner, *shares]
+        n_ann = min(int(rnd.expovariate(1 / annotations)) if annotations else 0, len(plain) // 4)
+        rows = []
+        for _ in range(n_ann):
+            start = rnd.randrange(0, max(1, len(plain) - 40))
+            end = min(len(plain), start + rnd.randint(5, 120))
+            rows.append({"version_id": prev.id, "user_id": rnd.choice(authors), "start_offset": start,
+                         "end_offset": end, "anchor_text": plain[start:end], "color": rnd.choice(COLORS)})
+        if rows:
+            ids = db.session.scalars(insert(Annotation).returning(Annotation.id, sort_by_parameter_order=True),
+                                     rows).all()
+            per_ann = [max(1, round(rnd.expovariate(1 / comments))) if comments else 0 for _ in ids]
+            crows = [{"annotation_id": ann_id, "user_id": rnd.choice(authors), "text": _sentence(rnd)}
+                     for ann_id, k in zip(ids, per_ann) for _ in range(k)]
+            if crows:
+                db.session.execute(insert(AnnotationComment), crows)
+            prev.ann_rev = 1
+            counts["annotations"] += len(ids)
+            counts["comments"] += len(crows)
+        search.backend().index_document(doc, prev)
+        counts["documents"] += 1
+        if (n + 1) % 100 == 0:
+            db.session.commit()
+            log(f"  {n + 1}/{docs} documents")
+    db.session.commit()
+    return counts
@@ -0,0 +1,237 @@
+"""Microbenchmarks over a generated dataset.
+
+    python -m bench.run --scale small --out bench-small.json
+    python -m bench.run --scale small --baseline bench-small.json
+
+Each case reports latency percentiles (ms) and SQL statements per call. The
+database is a throwaway SQLite file unless --db points at an existing one.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    # nearest rank
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+def summarize(times, queries):
+    ms = sorted(t * 1000 for t in times)
+    return {
+        "n": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "min_ms": round(ms[0], 3),
+        **{f"p{p}_ms": round(percentile(ms, p), 3) for p in (50, 90, 95, 99)},
+        "max_ms": round(ms[-1], 3),
+        "queries_mean": round(sum(queries) / len(queries), 2),
+        "queries_max": max(queries),
+    }
+
+class Runner:
+    def __init__(self, engine, iterations, warmup):
+        from sqlalchemy import event
+        self.iterations, self.warmup = iterations, warmup
+        self.statements = 0
+        self.results = {}
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.statements += 1
+
+    def case(self, name, fn, setup=None, iterations=None):
+        for _ in range(self.warmup):
+            setup and setup()
+            fn()
+        times, queries = [], []
+        for _ in range(iterations or self.iterations):
+            setup and setup()
+            self.statements = 0
+            t = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t)
+            queries.append(self.statements)
+        self.results[name] = summarize(times, queries)
+        r = self.results[name]
+        print(f"  {name:<32} p50 {r['p50_ms']:>9.3f}  p95 {r['p95_ms']:>9.3f}  "
+              f"p99 {r['p99_ms']:>9.3f} ms  queries {r['queries_mean']}")
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def _check(resp, status=200):
+    if resp.status_code != status:
+        raise RuntimeError(f"{resp.request.path}: expected {status}, got {resp.status_code}")
+
+def _pick(db):
+    """Subjects for the cases: the busiest document and the user who can see the most."""
+    from sqlalchemy import select, func
+    from models import Document, DocumentVersion, DocumentShare, Annotation, User
+    ann_doc = db.session.execute(
+        select(DocumentVersion.document_id, func.count(Annotation.id).label("n"))
+        .join(Annotation, Annotation.version_id == DocumentVersion.id)
+        .group_by(DocumentVersion.document_id).order_by(func.count(Annotation.id).desc()).limit(1)
+    ).first()
+    doc = db.session.get(Document, ann_doc.document_id if ann_doc else
+                         db.session.scalar(select(Document.id).limit(1)))
+    reader_id = db.session.scalar(select(DocumentShare.user_id).group_by(DocumentShare.user_id)
+                                  .order_by(func.count().desc()).limit(1)) or doc.owner_id
+    big = db.session.execute(select(DocumentVersion.id).where(DocumentVersion.delta.is_(None))
+                             .order_by(func.length(DocumentVersion._source_md).desc()).limit(1)).scalar()
+    return doc, db.session.get(User, doc.owner_id), db.session.get(User, reader_id), db.session.get(DocumentVersion, big)
+
+def run_cases(app, runner):
+    from models import db, Document
+    from services import annotation_cache, fast_json, render_cache
+    from services.markdown_render import render
+    from services.permissions import roles_for, can_view
+    from services.doc_index import page_documents
+    from bench.datagen import PASSWORD
+
+    with app.app_context():
+        doc, owner, reader, big = _pick(db)
+        md = big.source_md
+        page, _ = page_documents(reader, None, None)
+        doc_id, page_ids, reader_id = doc.id, [d.id for d in page], reader.id
+    print(f"subjects: document {doc_id}, owner {owner.username}, reader {reader.username}, "
+          f"render source {len(md)} bytes")
+
+    runner.case("render.cold", lambda: render(md), setup=render_cache.clear)
+    runner.case("render.warm", lambda: render(md))
+
+    def fresh_request(fn):
+        def call():
+            with app.test_request_context():
+                from models import User
+                fn(db.session.get(User, reader_id))  # new request context, so the g role memo starts empty
+        return call
+    docs_page = []
+    def load_page():
+        with app.app_context():
+            docs_page[:] = Document.query.filter(Document.id.in_(page_ids)).all()
+    load_page()
+    runner.case("permissions.roles_for_page", fresh_request(lambda u: roles_for(docs_page, u)))
+    runner.case("permissions.can_view", fresh_request(lambda u: can_view(docs_page[0], u)))
+
+    anon = app.test_client()
+    client = app.test_client()
+    _check(client.post("/auth/login", data={"username": reader.username, "password": PASSWORD}), 302)
+    owner_client = app.test_client()
+    _check(owner_client.post("/auth/login", data={"username": owner.username, "password": PASSWORD}), 302)
+
+    runner.case("index.anonymous", lambda: _check(anon.get("/")))
+    runner.case("index.reader", lambda: _check(client.get("/")))
+    runner.case("index.api_page", lambda: _check(client.get("/api/documents")))
+    runner.case("view_doc.owner", lambda: _check(owner_client.get(f"/documents/{doc_id}")))
+
+    url = f"/api/documents/{doc_id}/annotations"
+    runner.case("list_annotations.cold", lambda: _check(owner_client.get(url)), setup=annotation_cache.clear)
+    runner.case("list_annotations.warm", lambda: _check(owner_client.get(url)))
+    tag = owner_client.get(url).headers["ETag"]
+    runner.case("list_annotations.not_modified",
+                lambda: _check(owner_client.get(url, headers={"If-None-Match": tag}), 304))
+
+    # the two ways of building the shared payload, and of encoding the response body
+    with app.app_context():
+        version_id = annotation_cache.head(doc_id)[0]
+        items = annotation_cache.for_user(annotation_cache._project(version_id), owner, True)
+        if annotation_cache._build(version_id) != annotation_cache._project(version_id):
+            raise RuntimeError("annotation_cache._project disagrees with _build")
+        if json.loads(app.json.dumps(items)) != json.loads(fast_json.dumps(items)):
+            raise RuntimeError("fast_json output disagrees with app.json")
+    def in_app(fn):
+        def call():
+            with app.app_context():  # fresh session, so the ORM path hydrates every time
+                fn(version_id)
+        return call
+    runner.case("annotations.build_orm", in_app(annotation_cache._build))
+    runner.case("annotations.build_projection", in_app(annotation_cache._project))
+    runner.case("annotations.encode_jsonify", lambda: app.json.dumps(items))
+    runner.case("annotations.encode_fast_json", lambda: fast_json.dumps(items))
+
+def compare(baseline, current):
+    print(f"\n{'case':<32} {'p50 old':>10} {'p50 new':>10} {'change':>8}   queries old/new")
+    for name, new in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            print(f"{name:<32} {'-':>10} {new['p50_ms']:>10.3f}")
+            continue
+        change = (new["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0.0
+        print(f"{name:<32} {old['p50_ms']:>10.3f} {new['p50_ms']:>10.3f} {change:>+7.1f}%   "
+              f"{old['queries_mean']}/{new['queries_mean']}")
+
+def main(argv=None):
+    from bench.datagen import SCALES
+    ap = argparse.ArgumentParser(prog="python -m bench.run", description=__doc__.splitlines()[0])
+    ap.add_argument("--scale", choices=sorted(SCALES), default="small")
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--iterations", type=int, default=200)
+    ap.add_argument("--warmup", type=int, default=10)
+    ap.add_argument("--db", help="reuse this SQLite file (generated on first use)")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--baseline", help="earlier results JSON to compare against")
+    for key in ("users", "docs", "versions", "annotations", "comments", "paragraphs"):
+        ap.add_argument(f"--{key}", type=int, help=f"override the scale's {key}")
+    args = ap.parse_args(argv)
+
+    params = dict(SCALES[args.scale])
+    params.update({k: getattr(args, k) for k in params if getattr(args, k) is not None})
+    path = os.path.abspath(args.db) if args.db else os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    fresh = not os.path.exists(path)
+    # config.Config reads DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = "sqlite:///" + path
+    os.environ.setdefault("RENDER_POOL_WORKERS", "0")  # measure the inline render path
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from models import db
+    from bench.datagen import generate
+
+    app = create_app()
+    with app.app_context():
+        if fresh:
+            db.create_all()
+            print(f"generating {args.scale} dataset into {path}: {params}")
+            t = time.perf_counter()
+            dataset = generate(seed=args.seed, **params)
+            print(f"  done in {time.perf_counter() - t:.1f}s: {dataset}")
+        else:
+            from sqlalchemy import func, select
+            from models import User, Document, DocumentVersion, DocumentShare, Annotation, AnnotationComment
+            dataset = {name: db.session.scalar(select(func.count()).select_from(model)) for name, model in
+                       (("users", User), ("documents", Document), ("versions", DocumentVersion),
+                        ("shares", DocumentShare), ("annotations", Annotation), ("comments", AnnotationComment))}
+        runner = Runner(db.engine, args.iterations, args.warmup)
+
+    run_cases(app, runner)
+    from importlib.metadata import version
+    result = {
+        "meta": {"git_rev": _git_rev(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "flask": version("flask"), "sqlalchemy": version("sqlalchemy"), "scale": args.scale, "seed": args.seed,
+                 "params": params, "iterations": args.iterations, "warmup": args.warmup},
+        "dataset": dataset,
+        "results": runner.results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print(f"wrote {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), result)
+    return result
+
+if __name__ == "__main__":
+    main()
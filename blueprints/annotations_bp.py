@@ -1,46 +1,71 @@
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, request, jsonify, current_app, stream_with_context, abort
 from flask_login import current_user, login_required
-from sqlalchemy.orm import selectinload
-from models import db, Document, DocumentVersion, Annotation, AnnotationComment
-from services.permissions import can_annotate, can_view
+from models import db, Document, DocumentVersion, Annotation, AnnotationComment, VERSION_READY
+from services.permissions import can_annotate, can_view, can_edit
+from services import anchor_index, annotation_cache, annotation_io, events, fast_json, purge, search
+from services.database import read_only
 
 ann_bp = Blueprint("annotations", __name__, url_prefix="/api")
+CONTEXT = 256
+
+def _load_viewable_doc(doc_id):
+    doc = Document.query.get_or_404(doc_id)
+    user = current_user if getattr(current_user, "is_authenticated", False) else None
+    if not can_view(doc, user) and request.args.get("t") != doc.share_token:
+        abort(403)
+    return doc
 
 @ann_bp.route("/documents/<int:doc_id>/annotations", methods=["GET"])
+@read_only
 def list_annotations(doc_id):
-    doc = Document.query.get_or_404(doc_id)
-    version = (DocumentVersion.query
-               .filter_by(document_id=doc.id)
-               .order_by(DocumentVersion.number.desc())
-               .first())
-    if not version:
+    doc = _load_viewable_doc(doc_id)
+    head = annotation_cache.head(doc.id)
+    if not head:
+        return jsonify([])
+    version_id, rev = head
+
+    user = current_user if getattr(current_user, "is_authenticated", False) else None
+    # resolved once per request, not per annotation
+    user_can_edit = can_edit(doc, user) if user else False
+
+    tag = annotation_cache.etag(version_id, rev, user, user_can_edit)
+    if request.if_none_match.contains(tag):
+        resp = current_app.response_class(status=304)
+    else:
+        payload = annotation_cache.shared_payload(version_id, rev)
+        resp = fast_json.response(annotation_cache.for_user(payload, user, user_can_edit))
+    resp.set_etag(tag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+@ann_bp.route("/documents/<int:doc_id>/annotations/range", methods=["GET"])
+@read_only
+def list_annotations_range(doc_id):
+    doc = _load_viewable_doc(doc_id)
+    start = request.args.get("start", 0, type=int)
+    end = request.args.get("end", type=int)
+    if end is None or start < 0 or end <= start:
+        return ("need 0 <= start < end", 400)
+    head = annotation_cache.head(doc.id)
+    if not head:
         return jsonify([])
+    version_id, rev = head
 
     user = current_user if getattr(current_user, "is_authenticated", False) else None
+    user_can_edit = can_edit(doc, user) if user else False
+    items = annotation_cache.in_range(version_id, rev, start, end)
+    return fast_json.response(annotation_cache.for_user(items, user, user_can_edit))
 
-    anns = (Annotation.query
-            .options(selectinload(Annotation.comments), selectinload(Annotation.user))
-            .filter_by(version_id=version.id)
-            .all())
-
-    out = []
-    for a in anns:
-        content = a.comments[0].text if a.comments else ""
-        can_del = False
-        if user:
-            can_del = (a.user_id == getattr(user, "id", None)) or can_edit(version.document, user)
-        out.append({
-            "id": a.id,
-            "start": a.start_offset,
-            "end": a.end_offset,
-            "anchor": a.anchor_text,
-            "color": a.color,
-            "user": a.user.username,
-            "content": content,
-            "can_delete": can_del,
-            "comments": [{"id": c.id, "text": c.text, "user": c.user.username} for c in a.comments]
-        })
-    return jsonify(out)
+@ann_bp.route("/documents/<int:doc_id>/annotations/density", methods=["GET"])
+@read_only
+def annotation_density(doc_id):
+    doc = _load_viewable_doc(doc_id)
+    head = annotation_cache.head(doc.id)
+    if not head:
+        return jsonify({"version_id": None, "length": 0, "buckets": []})
+    buckets = max(1, min(request.args.get("buckets", 100, type=int), 1000))
+    return jsonify(annotation_cache.density(head.id, head.ann_rev, buckets))
 
 @ann_bp.route("/documents/<int:doc_id>/annotations", methods=["POST"])
 def create_annotation(doc_id):
@@ -53,7 +78,7 @@ def create_annotation(doc_id):
         return ("forbidden: no annotate permission", 403)
 
     version = (DocumentVersion.query
-               .filter_by(document_id=doc.id)
+               .filter_by(document_id=doc.id, status=VERSION_READY)
                .order_by(DocumentVersion.number.desc())
                .first())
     if version is None:
@@ -69,42 +94,163 @@ def create_annotation(doc_id):
     anchor = (data.get("anchor") or "").strip()
     color  = (data.get("color")  or "yellow").strip()
     note   = (data.get("note")   or "").strip()
+    # up to CONTEXT chars around the selection, to tell repeated phrases apart
+    prefix = str(data.get("prefix") or "")[-CONTEXT:]
+    suffix = str(data.get("suffix") or "")[:CONTEXT]
 
     plain = version.rendered_plain or ""
-    valid = (0 <= start < end <= len(plain))
+    text = anchor_index.dom_text(plain)  # what the browser selected from
+    valid = (0 <= start < end <= len(text)) and (not anchor or text[start:end] == anchor)
     if not valid and anchor:
-        pos = plain.find(anchor)
-        if pos != -1:
-            start, end = pos, pos + len(anchor)
+        found = anchor_index.resolve(version.id, plain, anchor, prefix, suffix,
+                                     hint=start if start >= 0 else None)
+        if found:
+            start, end = found
             valid = True
     if not valid:
-        return (f"invalid offsets and anchor not found (len={len(plain)})", 400)
+        return (f"invalid offsets and anchor not found (len={len(text)})", 400)
 
     try:
         ann = Annotation(version_id=version.id, user_id=current_user.id,
                          start_offset=start, end_offset=end,
-                         anchor_text=anchor or plain[start:end], color=color)
+                         anchor_text=anchor or text[start:end], color=color)
         db.session.add(ann)
         db.session.flush()  # get ann.id
 
         if note:
             db.session.add(AnnotationComment(annotation_id=ann.id, user_id=current_user.id, text=note))
 
+        annotation_cache.bump(version.id)
+        if note:
+            search.backend().update_comments(doc.id, version.id)
         db.session.commit()
-        return {"id": ann.id}, 201
+        _publish_created(doc.id, version.id, ann.id)
+        return {"id": ann.id, "start": start, "end": end}, 201
     except Exception as e:
         db.session.rollback()
         return (f"db error: {e}", 500)
 
+@ann_bp.route("/documents/<int:doc_id>/annotations/bulk", methods=["POST"])
+def import_annotations(doc_id):
+    if not getattr(current_user, "is_authenticated", False):
+        return ("login required", 401)
+    doc = Document.query.get_or_404(doc_id)
+    if not can_annotate(doc, current_user):
+        return ("forbidden: no annotate permission", 403)
+    version = (DocumentVersion.query
+               .filter_by(document_id=doc.id, status=VERSION_READY)
+               .order_by(DocumentVersion.number.desc())
+               .first())
+    if version is None:
+        return ("no version to annotate", 400)
+
+    # JSON array, or NDJSON (one annotation per line) for large batches
+    try:
+        if request.mimetype == "application/x-ndjson":
+            items = [json.loads(line) for line in request.stream if line.strip()]
+        else:
+            items = request.get_json(force=True)
+    except ValueError as e:
+        return (f"bad request body: {e}", 400)
+    if not isinstance(items, list):
+        return ("expected a list of annotations", 400)
+
+    plain, vid = version.rendered_plain or "", version.id
+    rows, rejected = annotation_io.validate(
+        items, anchor_index.dom_text(plain), resolve=lambda *args: anchor_index.resolve(vid, plain, *args))
+    chunk = current_app.config.get("BULK_CHUNK_SIZE", annotation_io.CHUNK_SIZE)
+    version_id, user_id = version.id, current_user.id
+    # only editors may import on behalf of other (existing) authors
+    inserted, error = annotation_io.import_rows(version_id, rows, user_id,
+                                                keep_authors=can_edit(doc, current_user), chunk_size=chunk)
+    if inserted:
+        # also after a failed chunk: the chunks before it are committed
+        annotation_cache.bump(version_id)
+        search.backend().update_comments(doc_id, version_id)
+        db.session.commit()
+        # too many to push one by one; clients refetch the list
+        events.publish(doc_id, "reset", {"version_id": version_id})
+    if error is not None:
+        return {"error": f"db error: {error}", "inserted": inserted, "rejected": rejected}, 500
+    return {"inserted": inserted, "rejected": rejected}, 201 if inserted else 200
+
+@ann_bp.route("/documents/<int:doc_id>/annotations/export", methods=["GET"])
+def export_annotations(doc_id):
+    doc = _load_viewable_doc(doc_id)
+    q = (db.session.query(DocumentVersion.id)
+         .filter_by(document_id=doc.id, status=VERSION_READY)
+         .order_by(DocumentVersion.number.desc()))
+    number = request.args.get("version", type=int)
+    if number is not None:
+        q = q.filter_by(number=number)
+    version_id = q.limit(1).scalar()
+    if version_id is None:
+        return ("no such version", 404)
+    return current_app.response_class(
+        stream_with_context(annotation_io.export_ndjson(version_id)),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename=document-{doc.id}-annotations.ndjson"})
+
 @ann_bp.route("/annotations/<int:ann_id>", methods=["DELETE", "POST"])
 def delete_annotation(ann_id):
     # allow form POST or AJAX DELETE
     if not getattr(current_user, "is_authenticated", False):
         return ("login required", 401)
-    ann = Annotation.query.get_or_404(ann_id)
-    doc = ann.version.document
-    if not (ann.user_id == current_user.id or can_edit(doc, current_user)):
+    # columns only: loading the Annotation would also selectin-load all its comments
+    row = (db.session.query(Annotation.user_id, Annotation.version_id, DocumentVersion.document_id)
+           .join(DocumentVersion, DocumentVersion.id == Annotation.version_id)
+           .filter(Annotation.id == ann_id)
+           .first_or_404())
+    doc = db.session.get(Document, row.document_id)
+    if not (row.user_id == current_user.id or can_edit(doc, current_user)):
         return ("forbidden", 403)
-    db.session.delete(ann)
+    version_id = row.version_id
+    purge.delete_annotations([ann_id])
+    annotation_cache.bump(version_id)
+    search.backend().update_comments(doc.id, version_id)
     db.session.commit()
-    return {"ok": True}, 200
\ No newline at end of file
+    events.publish(doc.id, "annotation.deleted", {"id": ann_id, "version_id": version_id})
+    return {"ok": True}, 200
+
+@ann_bp.route("/annotations/<int:ann_id>/comments", methods=["POST"])
+def create_comment(ann_id):
+    if not getattr(current_user, "is_authenticated", False):
+        return ("login required", 401)
+    ann = Annotation.query.get_or_404(ann_id)
+    if not can_annotate(ann.version.document, current_user):
+        return ("forbidden: no annotate permission", 403)
+    data = request.get_json(force=True) or {}
+    text = (data.get("text") or "").strip()
+    if not text:
+        return ("empty comment", 400)
+    c = AnnotationComment(annotation_id=ann.id, user_id=current_user.id, text=text)
+    db.session.add(c)
+    annotation_cache.bump(ann.version_id)
+    db.session.flush()
+    search.backend().update_comments(ann.version.document_id, ann.version_id)
+    db.session.commit()
+    events.publish(ann.version.document_id, "comment.created",
+                   {"annotation_id": ann.id, "version_id": ann.version_id,
+                    "comment": {"id": c.id, "text": c.text, "user": current_user.username}})
+    return {"id": c.id}, 201
+
+def _publish_created(doc_id, version_id, ann_id):
+    found = annotation_cache.item(version_id, ann_id)
+    if found:
+        author_id, item = found
+        events.publish(doc_id, "annotation.created", dict(item, user_id=author_id, version_id=version_id))
+
+@ann_bp.route("/documents/<int:doc_id>/events", methods=["GET"])
+def annotation_events(doc_id):
+    _load_viewable_doc(doc_id)
+    broker = events.backend()
+    if type(broker) is events.EventBroker:
+        return ("", 204)  # push disabled; 204 tells EventSource not to reconnect
+    # the broker parses its own ids; one it did not hand out gets a "reset"
+    last_id = request.headers.get("Last-Event-ID", request.args.get("last_id")) or None
+    cfg = current_app.config
+    db.session.remove()  # don't hold a connection for the life of the stream
+    body = events.stream(broker, doc_id, last_id, cfg.get("EVENTS_HEARTBEAT", 15),
+                         cfg.get("EVENTS_MAX_STREAM_SECONDS", 300))
+    return current_app.response_class(body, mimetype="text/event-stream",
+                                      headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
\ No newline at end of file
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
 from models import User, db
+from services import identity
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 
@@ -53,6 +54,7 @@ def login_submit():
 @auth_bp.post("/logout")
 @login_required
 def logout_submit():
+    identity.forget(current_user.id)
     logout_user()
     flash("Signed out.", "success")
     return redirect(url_for("index"))
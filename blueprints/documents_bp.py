@@ -1,10 +1,12 @@
 import secrets
-from flask import Blueprint, render_template, request, redirect, url_for, abort, jsonify, flash
+from flask import Blueprint, render_template, request, redirect, url_for, abort, jsonify, flash, current_app
 from flask_login import login_required, current_user
-from models import db, Document, DocumentVersion
-from services.markdown_render import render as render_md
+from models import db, Document, DocumentVersion, VERSION_READY, VERSION_RENDERING
+from services.anchor_index import dom_text
+from services.markdown_render import render_document
 from services.permissions import can_view, can_edit, can_annotate
-from services.markdown_render import render as render_mdc
+from services import precompress, purge, render_pool
+from services.database import read_only
 
 docs_bp = Blueprint("docs", __name__, url_prefix="/documents")
 
@@ -19,12 +21,27 @@ def create_doc():
     title = (request.form.get("title") or "Untitled").strip()
     md = request.form.get("markdown") or ""
     doc = Document(title=title, owner_id=current_user.id, share_token=secrets.token_hex(16))
-    html, plain = render_md(md)
-    v = DocumentVersion(document=doc, number=1, source_md=md, rendered_html=html, rendered_plain=plain)
-    db.session.add_all([doc, v])
-    db.session.commit()  # <-- critical
+    _add_version(doc, 1, md)
     return redirect(url_for("docs.edit_doc", doc_id=doc.id))
 
+def _add_version(doc, number, md):
+    # big sources render in the pool; the edit page polls version_status until it's ready
+    if render_pool.should_defer(md):
+        v = DocumentVersion(document=doc, number=number, source_md=md, rendered_html="", rendered_plain="",
+                            status=VERSION_RENDERING)
+        db.session.add_all([doc, v])
+        db.session.commit()  # <-- critical
+        if render_pool.submit(v.id, md) is not None:
+            return v
+        # pool unavailable: render here rather than leave the row "rendering"
+    else:
+        v = DocumentVersion(document=doc, number=number, source_md=md)
+        db.session.add_all([doc, v])
+    html, plain, sections = render_document(md)
+    render_pool.finish(v, html, plain, sections)
+    db.session.commit()  # <-- critical
+    return v
+
 @docs_bp.post("/<int:doc_id>/edit", endpoint="save_doc")
 @login_required
 def save_doc(doc_id):
@@ -37,10 +54,9 @@ def save_doc(doc_id):
             .order_by(DocumentVersion.number.desc())
             .first())
     number = (prev.number + 1) if prev else 1
-    html, plain = render_md(md)
-    v = DocumentVersion(document=doc, number=number, source_md=md, rendered_html=html, rendered_plain=plain)
-    db.session.add(v)
-    db.session.commit()  # <-- critical
+    v = _add_version(doc, number, md)
+    if v.status == VERSION_RENDERING:
+        return redirect(url_for("docs.edit_doc", doc_id=doc.id))
     return redirect(url_for("docs.view_doc", doc_id=doc.id))
 
 
@@ -59,22 +75,19 @@ def edit_doc(doc_id):
 @docs_bp.post("/<int:doc_id>/delete", endpoint="delete_doc")
 @login_required
 def delete_doc(doc_id):
-    from models import DocumentShare  # inline import to avoid cycles if any
     doc = Document.query.get_or_404(doc_id)
 
     # Owner-only delete (safer). Change to `can_edit` if you prefer editors too.
     if doc.owner_id != current_user.id:
         abort(403)
 
-    # Clean up shares explicitly (versions/annotations already cascade)
-    DocumentShare.query.filter_by(document_id=doc.id).delete(synchronize_session=False)
-
-    db.session.delete(doc)  # will cascade to versions -> annotations -> comments
-    db.session.commit()
+    # set-based deletes; very large documents are hidden now and purged in the background
+    purge.delete_document(doc)
     flash("Document deleted.", "success")
     return redirect(url_for("index"))
 
 @docs_bp.get("/<int:doc_id>", endpoint="view_doc")
+@read_only
 def view_doc(doc_id):
     doc = Document.query.get_or_404(doc_id)
     token = request.args.get("t")
@@ -82,11 +95,91 @@ def view_doc(doc_id):
     if not can_view(doc, user) and token != doc.share_token:
         abort(403)
     version = (DocumentVersion.query
-               .filter_by(document_id=doc.id)
+               .filter_by(document_id=doc.id, status=VERSION_READY)
                .order_by(DocumentVersion.number.desc())
                .first())
     can_annot = can_annotate(doc, user) if user else False
-    return render_template("document_view.html", document=doc, version=version, can_annotate=can_annot)
+    # large documents: inline the first sections up to VIEW_INITIAL_BYTES, the page fetches the rest;
+    # one big section is fetched whole from version_content (precompressed)
+    sections, pending, content_url = None, 0, None
+    large = version and len(version.rendered_html) > current_app.config["VIEW_INITIAL_BYTES"]
+    if large and len(version.sections or ()) <= 1:
+        content_url = url_for("docs.version_content", doc_id=doc.id, version_id=version.id, t=token)
+    elif large:
+        html, budget, sections = version.rendered_html, current_app.config["VIEW_INITIAL_BYTES"], []
+        # where each section starts in the page text annotation offsets index, so the page
+        # can draw highlights in a section as soon as it is loaded
+        plain, offset, seen = version.rendered_plain or "", 0, 0
+        for i, s in enumerate(version.sections):
+            a, b = s["html"]
+            offset += len(dom_text(plain[seen:s["plain"][0]]))
+            seen = s["plain"][0]
+            inline = budget > 0
+            budget -= b - a
+            sections.append(dict(s, index=i, offset=offset, body=html[a:b] if inline else None))
+            pending += not inline
+    return render_template("document_view.html", document=doc, version=version, can_annotate=can_annot,
+                           can_edit=can_edit(doc, user) if user else False,
+                           sections=sections, pending_sections=pending, content_url=content_url, token=token)
+
+@docs_bp.get("/<int:doc_id>/versions/<int:version_id>/status", endpoint="version_status")
+@login_required
+def version_status(doc_id, version_id):
+    doc = Document.query.get_or_404(doc_id)
+    if not can_edit(doc, current_user):
+        abort(403)
+    row = (db.session.query(DocumentVersion.number, DocumentVersion.status)
+           .filter_by(id=version_id, document_id=doc.id)
+           .first_or_404())
+    return jsonify({"id": version_id, "number": row.number, "status": row.status})
+
+@docs_bp.get("/<int:doc_id>/versions/<int:version_id>/sections", endpoint="version_sections")
+@read_only
+def version_sections(doc_id, version_id):
+    doc = Document.query.get_or_404(doc_id)
+    user = current_user if getattr(current_user, "is_authenticated", False) else None
+    if not can_view(doc, user) and request.args.get("t") != doc.share_token:
+        abort(403)
+    version = DocumentVersion.query.filter_by(id=version_id, document_id=doc.id).first_or_404()
+    table = version.sections or [{"html": [0, len(version.rendered_html)]}]
+    start = max(request.args.get("start", 0, type=int), 0)
+    end = min(request.args.get("end", start + 1, type=int), len(table))
+    html = version.rendered_html
+    resp = jsonify([{"index": i, "html": html[table[i]["html"][0]:table[i]["html"][1]]}
+                    for i in range(start, end)])
+    # a version's content never changes
+    resp.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return resp
+
+@docs_bp.get("/<int:doc_id>/versions/<int:version_id>/content", endpoint="version_content")
+@read_only
+def version_content(doc_id, version_id):
+    doc = Document.query.get_or_404(doc_id)
+    user = current_user if getattr(current_user, "is_authenticated", False) else None
+    if not can_view(doc, user) and request.args.get("t") != doc.share_token:
+        abort(403)
+    encoding = precompress.choose(request.accept_encodings)
+    tag = f"v{version_id}-{encoding or 'identity'}"
+    if request.if_none_match.contains(tag):
+        resp = current_app.response_class(status=304)
+    else:
+        stored = getattr(DocumentVersion, precompress.COLUMNS[encoding]) if encoding else DocumentVersion.id
+        row = (db.session.query(stored)
+               .filter_by(id=version_id, document_id=doc.id, status=VERSION_READY)
+               .first_or_404())
+        body = row[0] if encoding else None
+        if body is None:
+            # compacted (delta) versions and clients without gzip
+            html = db.session.get(DocumentVersion, version_id).rendered_html or ""
+            body = precompress.compress(html, encoding, fast=True) if encoding else html.encode("utf-8")
+        resp = current_app.response_class(body, mimetype="text/html")
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+    resp.set_etag(tag)
+    resp.vary.add("Accept-Encoding")
+    # a version's content never changes
+    resp.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return resp
 
 @docs_bp.post("/<int:doc_id>/toggle_public", endpoint="toggle_public")
 @login_required
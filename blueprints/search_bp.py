@@ -0,0 +1,17 @@
+from flask import Blueprint, request, jsonify, url_for
+from flask_login import current_user
+from services import search
+
+search_bp = Blueprint("search", __name__, url_prefix="/api")
+
+@search_bp.get("/search")
+def search_docs():
+    user = current_user if getattr(current_user, "is_authenticated", False) else None
+    try:
+        limit = max(1, min(int(request.args.get("limit", 20)), 100))
+    except ValueError:
+        limit = 20
+    hits = search.backend().search(request.args.get("q", ""), user, limit=limit)
+    for h in hits:
+        h["url"] = url_for("docs.view_doc", doc_id=h["id"])
+    return jsonify({"backend": search.backend().name, "results": hits})
@@ -1,6 +1,9 @@
-from flask import Blueprint, request, redirect, url_for, abort
+from flask import Blueprint, request, redirect, url_for, abort, flash
 from flask_login import login_required, current_user
-from models import db, Document, DocumentShare, User, ROLE_OWNER, ROLE_EDITOR, ROLE_ANNOTATOR, ROLE_VIEWER
+from sqlalchemy import select
+from models import db, Document, ROLE_VIEWER
+from services import sharing
+from services.permissions import forget_roles
 
 
 share_bp = Blueprint("share", __name__, url_prefix="/share")
@@ -11,19 +14,62 @@ def grant(doc_id):
     doc = Document.query.get_or_404(doc_id)
     if doc.owner_id != current_user.id:
         abort(403)
-    username = (request.form.get("username") or "").strip()
+    username = sharing.clean_username(request.form.get("username"))
     role = (request.form.get("role") or ROLE_VIEWER)
-    if role not in {ROLE_OWNER, ROLE_EDITOR, ROLE_ANNOTATOR, ROLE_VIEWER}:
+    if role not in sharing.ROLES:
         role = ROLE_VIEWER
-    user = User.query.filter_by(username=username).first()
-    if not user:
-        user = User(username=username)
-        db.session.add(user)
-        db.session.commit()
-    existing = DocumentShare.query.filter_by(document_id=doc.id, user_id=user.id).first()
-    if existing:
-        existing.role = role
-    else:
-        db.session.add(DocumentShare(document_id=doc.id, user_id=user.id, role=role))
+    if not username:
+        flash("Username is required.", "error")
+        return redirect(url_for("docs.edit_doc", doc_id=doc.id))
+    uid = sharing.user_ids([username], create=True)[username]
+    sharing.grant([doc.id], {uid: role})
     db.session.commit()
-    return redirect(url_for("docs.edit_doc", doc_id=doc.id))
\ No newline at end of file
+    forget_roles(doc.id)
+    return redirect(url_for("docs.edit_doc", doc_id=doc.id))
+
+@share_bp.post("/bulk")
+@login_required
+def bulk():
+    """{"documents": [ids], "grant": [{"username", "role"}], "revoke": [usernames]}, one transaction."""
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return ("expected a JSON object", 400)
+    documents, grants, revokes = (data.get(k) or [] for k in ("documents", "grant", "revoke"))
+    if not all(isinstance(x, list) for x in (documents, grants, revokes)):
+        return ("documents, grant and revoke must be lists", 400)
+    if not all(isinstance(d, int) and not isinstance(d, bool) for d in documents):
+        return ("documents must be ids", 400)
+    if not all(isinstance(g, (str, dict)) for g in grants):
+        return ("grant entries must be usernames or {username, role} objects", 400)
+    if not all(isinstance(n, str) for n in revokes):
+        return ("revoke entries must be usernames", 400)
+    doc_ids = sorted(set(documents))
+    if not doc_ids:
+        return ("no documents", 400)
+    owned = set(db.session.scalars(select(Document.id).where(Document.id.in_(doc_ids),
+                                                             Document.owner_id == current_user.id,
+                                                             Document.deleted_at.is_(None))))
+    if owned != set(doc_ids):
+        return ({"error": "not found or not owner", "documents": sorted(set(doc_ids) - owned)}, 403)
+
+    roles, rejected = {}, []
+    for i, item in enumerate(grants):
+        name = sharing.clean_username(item.get("username") if isinstance(item, dict) else item)
+        role = (item.get("role") if isinstance(item, dict) else None) or ROLE_VIEWER
+        if not name or not isinstance(role, str) or role not in sharing.ROLES:
+            rejected.append({"index": i, "error": "bad username or role"})
+            continue
+        roles[name] = role  # last one wins
+    revoke = {n for n in map(sharing.clean_username, revokes) if n} - set(roles)
+
+    try:
+        ids = sharing.user_ids(roles, create=True)
+        granted = sharing.grant(doc_ids, {ids[n]: r for n, r in roles.items()})
+        revoked = sharing.revoke(doc_ids, list(sharing.user_ids(revoke).values())) if revoke else 0
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return (f"db error: {e}", 500)
+    for doc_id in doc_ids:
+        forget_roles(doc_id)
+    return {"granted": granted, "revoked": revoked, "rejected": rejected}, 200
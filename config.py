@@ -8,6 +8,72 @@ class Config:
         f"sqlite:///{os.path.join(basedir, 'annotator.db')}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    RENDER_CACHE_PERSIST = os.getenv("RENDER_CACHE_PERSIST", "0") == "1"
+    VERSION_SNAPSHOT_EVERY = int(os.getenv("VERSION_SNAPSHOT_EVERY", 10))
+    ANNOTATION_CACHE_ITEMS = int(os.getenv("ANNOTATION_CACHE_ITEMS", 256))
+    ANCHOR_INDEX_MAX_BYTES = int(os.getenv("ANCHOR_INDEX_MAX_BYTES", 128 * 1024 * 1024))
+    SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")  # auto | sqlite-fts5 | none
+    VIEW_INITIAL_BYTES = int(os.getenv("VIEW_INITIAL_BYTES", 256 * 1024))
+    BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 1000))
+    # documents with more annotations than this are deleted by a background purge
+    PURGE_INLINE_MAX_ROWS = int(os.getenv("PURGE_INLINE_MAX_ROWS", 5000))
+    PURGE_CHUNK_SIZE = int(os.getenv("PURGE_CHUNK_SIZE", 1000))
+    # sources at least this large render in the process pool; 0 workers = always inline
+    RENDER_INLINE_MAX_BYTES = int(os.getenv("RENDER_INLINE_MAX_BYTES", 256 * 1024))
+    RENDER_POOL_WORKERS = int(os.getenv("RENDER_POOL_WORKERS", 2))
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+    METRICS_SLOW_QUERY_MS = float(os.getenv("METRICS_SLOW_QUERY_MS", 200))
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # if set, /metrics wants "Authorization: Bearer <token>"
+
+    SQLITE_PRAGMAS = {}
+    EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "local")  # local | none
+    EVENTS_LOG_SIZE = int(os.getenv("EVENTS_LOG_SIZE", 500))  # per document, for Last-Event-ID replay
+    EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", 15))
+    EVENTS_MAX_STREAM_SECONDS = float(os.getenv("EVENTS_MAX_STREAM_SECONDS", 300))
+    FAST_START = os.getenv("FAST_START", "0") == "1"
+    JINJA_BYTECODE_CACHE_DIR = os.getenv("JINJA_BYTECODE_CACHE_DIR")
+    AUTO_CREATE_TABLES = True  # run.py dev bootstrap
+    WARMUP_DOCUMENTS = int(os.getenv("WARMUP_DOCUMENTS", 0))
+    STARTUP_REPORT = os.getenv("STARTUP_REPORT", "0") == "1"
+    IDENTITY_CACHE = os.getenv("IDENTITY_CACHE", "local")  # local | none
+    IDENTITY_CACHE_TTL = int(os.getenv("IDENTITY_CACHE_TTL", 300))
+    IDENTITY_CACHE_ITEMS = int(os.getenv("IDENTITY_CACHE_ITEMS", 10000))
+    DB_REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", 5))
+
+def _engine_options(url):
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 20)),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": True,
+    }
 
 class Dev(Config): DEBUG = True
-class Prod(Config): DEBUG = False
+
+class Prod(Config):
+    DEBUG = False
+    FAST_START = os.getenv("FAST_START", "1") == "1"
+    JINJA_BYTECODE_CACHE_DIR = os.getenv("JINJA_BYTECODE_CACHE_DIR", os.path.join(basedir, "instance", "jinja-cache"))
+    AUTO_CREATE_TABLES = False  # schema comes from `flask db upgrade`
+    WARMUP_DOCUMENTS = int(os.getenv("WARMUP_DOCUMENTS", 50))
+    STARTUP_REPORT = os.getenv("STARTUP_REPORT", "1") == "1"
+    # WAL lets readers run alongside the single writer; busy_timeout makes
+    # writers wait for the lock instead of failing with "database is locked"
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        "cache_size": -64000,  # KiB
+        "temp_store": "MEMORY",
+        "mmap_size": 256 * 1024 * 1024,
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(Config.SQLALCHEMY_DATABASE_URI)
+    # read-only views (see services.database.read_only) use this when set
+    if os.getenv("DATABASE_REPLICA_URL"):
+        SQLALCHEMY_BINDS = {"replica": os.getenv("DATABASE_REPLICA_URL")}
+
+CONFIGS = {"dev": Dev, "prod": Prod}
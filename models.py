@@ -2,8 +2,9 @@ import datetime as dt
 from flask_login import UserMixin, current_user
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
+from services.database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 ROLE_OWNER = "owner"
 ROLE_EDITOR = "editor"
@@ -11,6 +12,10 @@ ROLE_ANNOTATOR = "annotator"
 ROLE_VIEWER = "viewer"
 ROLE_ORDER = {ROLE_VIEWER: 1, ROLE_ANNOTATOR: 2, ROLE_EDITOR: 3, ROLE_OWNER: 4}
 
+VERSION_READY = "ready"
+VERSION_RENDERING = "rendering"  # handed to services.render_pool, html/plain not filled in yet
+VERSION_FAILED = "failed"
+
 class User(UserMixin, db.Model):
     __tablename__ = "users"
     id = db.Column(db.Integer, primary_key=True)
@@ -33,6 +38,15 @@ class Document(db.Model):
     share_token = db.Column(db.String(64), index=True, unique=True)
     created_at = db.Column(db.DateTime, default=dt.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=dt.datetime.utcnow, onupdate=dt.datetime.utcnow)
+    # set while services.purge removes a large document in the background; hidden from everyone
+    deleted_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # keyset pagination of the index on (updated_at, id), see services.doc_index
+        db.Index("ix_documents_updated_id", "updated_at", "id"),
+        db.Index("ix_documents_owner_updated_id", "owner_id", "updated_at", "id"),
+        db.Index("ix_documents_public_updated_id", "is_public", "updated_at", "id"),
+    )
 
     owner = db.relationship("User")
     versions = db.relationship(
@@ -42,17 +56,45 @@ class Document(db.Model):
         order_by="DocumentVersion.number"
     )
 
+def _stored_text(field):
+    # full text lives in the column unless the row was compacted to a delta
+    attr = "_" + field
+    def fget(self):
+        if self.delta is None:
+            return getattr(self, attr)
+        from services.version_store import materialize
+        return materialize(self)[field]
+    def fset(self, value):
+        setattr(self, attr, value)
+    return property(fget, fset)
+
 class DocumentVersion(db.Model):
     __tablename__ = "document_versions"
     id = db.Column(db.Integer, primary_key=True)
     document_id = db.Column(db.Integer, db.ForeignKey("documents.id"), index=True, nullable=False)
     number = db.Column(db.Integer, nullable=False)
-    source_md = db.Column(db.Text, nullable=False)
-    rendered_html = db.Column(db.Text, nullable=False)
-    rendered_plain = db.Column(db.Text, nullable=False)
+    _source_md = db.Column("source_md", db.Text)
+    _rendered_html = db.Column("rendered_html", db.Text)
+    _rendered_plain = db.Column("rendered_plain", db.Text)
+    # reverse delta against base_version (see services.version_store); NULL for full rows
+    base_version_id = db.Column(db.Integer, db.ForeignKey("document_versions.id"))
+    delta = db.Column(db.LargeBinary)
+    # section table from markdown_render.split_sections: html/plain [start, end) per heading
+    sections = db.Column(db.JSON)
+    # bumped on every annotation/comment write; keys the cached annotations payload + ETag
+    ann_rev = db.Column(db.Integer, default=0, nullable=False)
+    status = db.Column(db.String(16), default=VERSION_READY, nullable=False)
+    # rendered_html compressed once at render time, see services.precompress (br needs brotli)
+    html_gzip = db.orm.deferred(db.Column(db.LargeBinary))
+    html_br = db.orm.deferred(db.Column(db.LargeBinary))
     created_at = db.Column(db.DateTime, default=dt.datetime.utcnow)
 
+    source_md = db.synonym("_source_md", descriptor=_stored_text("source_md"))
+    rendered_html = db.synonym("_rendered_html", descriptor=_stored_text("rendered_html"))
+    rendered_plain = db.synonym("_rendered_plain", descriptor=_stored_text("rendered_plain"))
+
     document = db.relationship("Document", back_populates="versions")
+    base_version = db.relationship("DocumentVersion", remote_side=[id])
     annotations = db.relationship("Annotation", backref="version", cascade="all, delete-orphan")
 
 class Annotation(db.Model):
@@ -64,8 +106,16 @@ class Annotation(db.Model):
     end_offset = db.Column(db.Integer, nullable=False)
     anchor_text = db.Column(db.Text, nullable=False)
     color = db.Column(db.String(16), default="#ffeb3b")
+    # set when a newer version was saved and this range could not be carried over to it
+    orphaned = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, default=dt.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=dt.datetime.utcnow, onupdate=dt.datetime.utcnow)
+
+    __table_args__ = (
+        # overlap lookups for viewport loading, see annotation_cache.in_range
+        db.Index("ix_annotations_version_range", "version_id", "start_offset", "end_offset"),
+    )
+
     user = db.relationship("User")
 
     # Add/replace this relationship definition
@@ -95,5 +145,19 @@ class DocumentShare(db.Model):
     role = db.Column(db.String(24), nullable=False)
     created_at = db.Column(db.DateTime, default=dt.datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_document_shares_user_doc", "user_id", "document_id"),
+        # one role per user and document; services.sharing upserts on it
+        db.UniqueConstraint("document_id", "user_id", name="uq_document_shares_doc_user"),
+    )
+
     document = db.relationship("Document", backref="shares")
     user = db.relationship("User")
+
+class RenderCacheEntry(db.Model):
+    __tablename__ = "render_cache"
+    key = db.Column(db.String(64), primary_key=True)  # sha256(renderer config + source)
+    rendered_html = db.Column(db.Text, nullable=False)
+    rendered_plain = db.Column(db.Text, nullable=False)
+    sections = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=dt.datetime.utcnow)
@@ -1,9 +1,8 @@
 from app import create_app
-from models import db, User   # <-- importing models here registers ALL tables
+from models import db   # <-- importing models here registers ALL tables
 # add in app.py (after db.init_app(app) / before returning app)
 from sqlalchemy import inspect
-from flask_migrate import Migrate
-from flask_login import LoginManager, current_user
+from services import startup
 
 def _ensure_tables(app):
     with app.app_context():
@@ -15,5 +14,7 @@ def _ensure_tables(app):
 
 if __name__ == '__main__':
     app = create_app()
-    _ensure_tables(app)
+    if app.config["AUTO_CREATE_TABLES"]:
+        _ensure_tables(app)
+    startup.warm_up(app)
     app.run('0.0.0.0',90)
\ No newline at end of file
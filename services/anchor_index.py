@@ -0,0 +1,94 @@
+import html
+import re
+from array import array
+from services.cache import LRUCache
+
+# Word -> start offsets in a version's rendered_plain, so resolving an anchor
+# costs one dict lookup (on its rarest word) plus a startswith per candidate
+# instead of a scan of the whole text. When a phrase occurs more than once,
+# the client's prefix/suffix context, then the distance to its (stale)
+# offsets, picks the occurrence. rendered_plain never changes for a version,
+# so indexes are cached per version id.
+_word = re.compile(r"\w+")
+_indexes = LRUCache(max_bytes=128 * 1024 * 1024, sizeof=lambda index: index.nbytes)
+
+def dom_text(plain):
+    # rendered_plain keeps bleach's &amp; &lt; &gt;; the page text (and client offsets) don't
+    return html.unescape(plain) if "&" in plain else plain
+
+def configure(config):
+    _indexes.max_bytes = config.get("ANCHOR_INDEX_MAX_BYTES", _indexes.max_bytes)
+
+class AnchorIndex:
+    __slots__ = ("plain", "positions", "nbytes")
+
+    def __init__(self, plain):
+        self.plain = plain
+        positions = {}
+        for m in _word.finditer(plain):
+            positions.setdefault(m.group(), array("i")).append(m.start())
+        self.positions = positions
+        # rough footprint: the text, 4 bytes per position, dict/array overhead per distinct word
+        self.nbytes = len(plain) + sum(len(a) for a in positions.values()) * 4 + len(positions) * 150
+
+    def find_all(self, anchor):
+        """Every start offset of ``anchor`` in the text, ascending."""
+        if not anchor:
+            return []
+        # words with a non-word char on both sides inside the anchor are whole words in
+        # the text too, so the rarest of them pins every candidate; each is checked in full
+        inner = [m for m in _word.finditer(anchor) if 0 < m.start() and m.end() < len(anchor)]
+        plain = self.plain
+        if inner:
+            m = min(inner, key=lambda m: len(self.positions.get(m.group(), ())))
+            shift = m.start()
+            return [p - shift for p in self.positions.get(m.group(), ())
+                    if p >= shift and plain.startswith(anchor, p - shift)]
+        hits, pos = [], plain.find(anchor)  # a word or two: plain scan
+        while pos != -1:
+            hits.append(pos)
+            pos = plain.find(anchor, pos + 1)
+        return hits
+
+    def best(self, anchor, prefix="", suffix="", hint=None):
+        """Start offset of the occurrence matching the context best, or None.
+
+        Looks up anchor+context as one longer phrase (its rarest word is usually
+        unique), trimming the context until it matches; remaining ties go to
+        the occurrence nearest ``hint``.
+        """
+        if not anchor:
+            return None
+        for k in (max(len(prefix), len(suffix)), 32, 8):
+            pre, suf = prefix[-k:] if k else "", suffix[:k]
+            for p, q in ((pre, suf), (pre, ""), ("", suf)):
+                if p or q:
+                    hits = self.find_all(p + anchor + q)
+                    if hits:
+                        return self._nearest([h + len(p) for h in hits], hint)
+        return self._nearest(self.find_all(anchor), hint)
+
+    @staticmethod
+    def _nearest(hits, hint):
+        if not hits:
+            return None
+        if hint is None or len(hits) == 1:
+            return hits[0]
+        return min(hits, key=lambda h: abs(h - hint))
+
+def for_version(version_id, plain):
+    """Index of ``dom_text(plain)``; offsets it returns are in that text."""
+    key = (version_id, len(plain))
+    index = _indexes.get(key)
+    if index is None:
+        index = AnchorIndex(dom_text(plain))
+        _indexes.put(key, index)
+    return index
+
+def resolve(version_id, plain, anchor, prefix="", suffix="", hint=None):
+    """(start, end) of ``anchor`` in the version's page text, or None if it does not occur."""
+    start = for_version(version_id, plain).best(anchor, prefix or "", suffix or "", hint)
+    return None if start is None else (start, start + len(anchor))
+
+def stats():
+    return _indexes.stats()
@@ -0,0 +1,143 @@
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import aliased, selectinload
+from models import db, DocumentVersion, Annotation, AnnotationComment, User, VERSION_READY
+from services.anchor_index import dom_text
+from services.cache import LRUCache
+
+# Serialized annotation lists per (version_id, ann_rev). Every annotation or
+# comment write bumps DocumentVersion.ann_rev, so a stale entry is simply
+# never asked for again and ages out of the LRU, in any worker process.
+_payloads = LRUCache(max_items=256)
+
+def configure(config):
+    _payloads.max_items = config.get("ANNOTATION_CACHE_ITEMS", _payloads.max_items)
+
+def bump(version_id):
+    db.session.execute(update(DocumentVersion)
+                       .where(DocumentVersion.id == version_id)
+                       .values(ann_rev=DocumentVersion.ann_rev + 1))
+
+def head(doc_id):
+    """(version_id, ann_rev) of the latest version, without loading its text."""
+    return db.session.execute(
+        select(DocumentVersion.id, DocumentVersion.ann_rev)
+        .where(DocumentVersion.document_id == doc_id, DocumentVersion.status == VERSION_READY)
+        .order_by(DocumentVersion.number.desc())
+        .limit(1)
+    ).first()
+
+def etag(version_id, rev, user, user_can_edit):
+    # can_delete is the only per-user field, and it only depends on these two
+    uid = user.id if user else 0
+    return f"ann-{version_id}-{rev}-{uid}-{int(bool(user_can_edit))}"
+
+def _build(version_id, *criteria):
+    # ORM path, kept as the reference for _project (see bench/run.py)
+    anns = (Annotation.query
+            .options(selectinload(Annotation.comments), selectinload(Annotation.user))
+            .filter(Annotation.version_id == version_id, *criteria)
+            .order_by(Annotation.id)
+            .all())
+    out = []
+    for a in anns:
+        content = a.comments[0].text if a.comments else ""
+        out.append((a.user_id, {
+            "id": a.id,
+            "start": a.start_offset,
+            "end": a.end_offset,
+            "anchor": a.anchor_text,
+            "color": a.color,
+            "user": a.user.username,
+            "content": content,
+            "comments": [{"id": c.id, "text": c.text, "user": c.user.username} for c in a.comments]
+        }))
+    return out
+
+def _project(version_id, *criteria):
+    """Same result as _build from one joined query over plain columns, without ORM objects."""
+    author, commenter = aliased(User), aliased(User)
+    rows = db.session.execute(
+        select(Annotation.id, Annotation.user_id, Annotation.start_offset, Annotation.end_offset,
+               Annotation.anchor_text, Annotation.color, author.username,
+               AnnotationComment.id, AnnotationComment.text, commenter.username)
+        .join(author, author.id == Annotation.user_id)
+        .outerjoin(AnnotationComment, AnnotationComment.annotation_id == Annotation.id)
+        .outerjoin(commenter, commenter.id == AnnotationComment.user_id)
+        .where(Annotation.version_id == version_id, *criteria)
+        .order_by(Annotation.id, AnnotationComment.id)
+    ).tuples()
+    out, last_id, comments = [], None, None
+    for ann_id, user_id, start, end, anchor, color, username, c_id, c_text, c_user in rows:
+        if ann_id != last_id:
+            last_id, comments = ann_id, []
+            item = {"id": ann_id, "start": start, "end": end, "anchor": anchor, "color": color,
+                    "user": username, "content": c_text if c_id is not None else "", "comments": comments}
+            out.append((user_id, item))
+        if c_id is not None:
+            comments.append({"id": c_id, "text": c_text, "user": c_user})
+    return out
+
+def item(version_id, ann_id):
+    """(author_id, item) for one annotation, built like the cached list entries."""
+    found = _project(version_id, Annotation.id == ann_id)
+    return found[0] if found else None
+
+def shared_payload(version_id, rev):
+    """[(author_id, item)] shared by all users; items lack the per-user can_delete."""
+    key = (version_id, rev)
+    payload = _payloads.get(key)
+    if payload is None:
+        payload = _project(version_id)
+        _payloads.put(key, payload)
+    return payload
+
+def max_span(version_id, rev):
+    # widest annotation on the version; bounds the index range scan in in_range()
+    key = ("span", version_id, rev)
+    span = _payloads.get(key)
+    if span is None:
+        span = db.session.scalar(select(func.max(Annotation.end_offset - Annotation.start_offset))
+                                 .where(Annotation.version_id == version_id)) or 0
+        _payloads.put(key, span)
+    return span
+
+def in_range(version_id, rev, start, end):
+    """[(author_id, item)] for annotations overlapping [start, end), by position."""
+    # overlap is start_offset < end AND end_offset > start; the lower bound on
+    # start_offset turns it into a bounded scan of (version_id, start_offset, end_offset)
+    lo = start - max_span(version_id, rev)
+    items = _project(version_id,
+                     Annotation.start_offset < end, Annotation.start_offset >= lo,
+                   Annotation.end_offset > start)
+    return sorted(items, key=lambda p: (p[1]["start"], p[1]["id"]))
+
+def density(version_id, rev, buckets):
+    """Annotation counts per equal-width bucket of the page text (by start offset)."""
+    key = ("density", version_id, rev, buckets)
+    out = _payloads.get(key)
+    if out is None:
+        # offsets index the unescaped text, which is shorter than rendered_plain when it has &amp; etc.
+        plain = db.session.scalar(select(DocumentVersion._rendered_plain).where(DocumentVersion.id == version_id))
+        length = len(dom_text(plain or ""))
+        counts = [0] * buckets
+        if length:
+            bucket = (Annotation.start_offset * buckets / length).label("bucket")
+            rows = db.session.execute(select(bucket, func.count())
+                                      .where(Annotation.version_id == version_id)
+                                      .group_by(bucket)).all()
+            for b, n in rows:
+                counts[min(max(int(b), 0), buckets - 1)] += n
+        out = {"version_id": version_id, "length": length, "buckets": counts}
+        _payloads.put(key, out)
+    return out
+
+def for_user(payload, user, user_can_edit):
+    uid = user.id if user else None
+    return [dict(item, can_delete=bool(user) and (author_id == uid or user_can_edit))
+            for author_id, item in payload]
+
+def clear():
+    _payloads.clear()
+
+def stats():
+    return _payloads.stats()
@@ -0,0 +1,139 @@
+import json
+from sqlalchemy import select, insert
+from sqlalchemy.orm import aliased
+from models import db, User, Annotation, AnnotationComment
+
+CHUNK_SIZE = 1000
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+def _name(obj):
+    user = obj.get("user")
+    return user if isinstance(user, str) else None
+
+def _find(plain, anchor, prefix, suffix, hint):
+    pos = plain.find(anchor)
+    return None if pos == -1 else (pos, pos + len(anchor))
+
+def _optional_str(value):
+    return value is None or isinstance(value, str)
+
+def _shape_error(item):
+    """Why ``item``'s fields have the wrong JSON types, or None."""
+    for field in ("anchor", "note", "prefix", "suffix", "color", "user"):
+        if not _optional_str(item.get(field)):
+            return f"{field} must be a string"
+    comments = item.get("comments")
+    if comments is not None and not isinstance(comments, list):
+        return "comments must be a list"
+    for c in comments or []:
+        if isinstance(c, str):
+            continue
+        if not isinstance(c, dict) or not _optional_str(c.get("text")) or not _optional_str(c.get("user")):
+            return "comments must be strings or objects with string text/user"
+    return None
+
+def validate(items, plain, resolve=None):
+    """Split raw import items into (rows, rejected) checking offsets/anchors against ``plain`` once.
+
+    ``plain`` is the page text offsets refer to (anchor_index.dom_text of rendered_plain).
+
+    ``resolve(anchor, prefix, suffix, hint)`` relocates anchors whose offsets
+    don't match (see anchor_index.resolve); defaults to the first occurrence.
+    """
+    resolve = resolve or (lambda *args: _find(plain, *args))
+    rows, rejected = [], []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            rejected.append({"index": i, "error": "not an object"})
+            continue
+        error = _shape_error(item)
+        if error:
+            rejected.append({"index": i, "error": error})
+            continue
+        try:
+            start, end = int(item.get("start", -1)), int(item.get("end", -1))
+        except (TypeError, ValueError):
+            start = end = -1
+        anchor = (item.get("anchor") or "").strip()
+        if not (0 <= start < end <= len(plain)) or (anchor and plain[start:end] != anchor):
+            found = anchor and resolve(anchor, item.get("prefix") or "", item.get("suffix") or "",
+                                       start if start >= 0 else None)
+            if not found:
+                rejected.append({"index": i, "error": "invalid offsets and anchor not found"})
+                continue
+            start, end = found
+        comments = [c if isinstance(c, dict) else {"text": c} for c in item.get("comments") or []]
+        if item.get("note"):
+            comments.insert(0, {"text": item["note"]})
+        rows.append({"start": start, "end": end, "anchor": anchor or plain[start:end],
+                     "color": (item.get("color") or "yellow").strip(), "user": _name(item),
+                     "comments": [{"text": c["text"].strip(), "user": _name(c)}
+                                  for c in comments if (c.get("text") or "").strip()]})
+    return rows, rejected
+
+def import_rows(version_id, rows, default_user_id, keep_authors=False, chunk_size=CHUNK_SIZE):
+    """Insert validated rows with executemany, one transaction per chunk.
+
+    Returns (inserted, error): chunks committed before a failing one stay in,
+    so callers refresh caches/index/subscribers whenever ``inserted`` > 0.
+    """
+    names = {r["user"] for r in rows if r["user"]}
+    names |= {c.get("user") for r in rows for c in r["comments"] if c.get("user")}
+    user_ids = {}
+    if names and keep_authors:
+        # authors are kept when they exist here; everything else is attributed to the importer
+        user_ids = dict(db.session.execute(select(User.username, User.id)
+                                           .where(User.username.in_(names))).all())
+    inserted = 0
+    try:
+        for i in range(0, len(rows), chunk_size):
+            inserted += _insert_chunk(version_id, rows[i:i + chunk_size], user_ids, default_user_id)
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return inserted, e
+    return inserted, None
+
+def _insert_chunk(version_id, chunk, user_ids, default_user_id):
+    ids = db.session.scalars(
+        insert(Annotation).returning(Annotation.id, sort_by_parameter_order=True),
+        [{"version_id": version_id, "user_id": user_ids.get(r["user"], default_user_id),
+          "start_offset": r["start"], "end_offset": r["end"],
+          "anchor_text": r["anchor"], "color": r["color"]} for r in chunk]
+    ).all()
+    comments = [{"annotation_id": ann_id, "user_id": user_ids.get(c.get("user"), default_user_id),
+                 "text": c["text"]}
+                for ann_id, r in zip(ids, chunk) for c in r["comments"]]
+    if comments:
+        db.session.execute(insert(AnnotationComment), comments)
+    return len(ids)
+
+def export_ndjson(version_id, batch=1000):
+    """Yield one JSON line per annotation (comments inlined) without building ORM objects."""
+    author, commenter = aliased(User), aliased(User)
+    stmt = (select(Annotation.id, Annotation.start_offset, Annotation.end_offset, Annotation.anchor_text,
+                   Annotation.color, Annotation.orphaned, Annotation.created_at, author.username,
+                   AnnotationComment.id, AnnotationComment.text, AnnotationComment.created_at,
+                   commenter.username)
+            .join(author, author.id == Annotation.user_id)
+            .outerjoin(AnnotationComment, AnnotationComment.annotation_id == Annotation.id)
+            .outerjoin(commenter, commenter.id == AnnotationComment.user_id)
+            .where(Annotation.version_id == version_id)
+            .order_by(Annotation.id, AnnotationComment.id))
+    result = db.session.execute(stmt.execution_options(yield_per=batch))
+    current = None
+    for (ann_id, start, end, anchor, color, orphaned, created, username,
+         c_id, c_text, c_created, c_user) in result:
+        if current is None or current["id"] != ann_id:
+            if current is not None:
+                yield json.dumps(current) + "\n"
+            current = {"id": ann_id, "version_id": version_id, "start": start, "end": end,
+                       "anchor": anchor, "color": color, "orphaned": bool(orphaned),
+                       "user": username, "created_at": _iso(created), "comments": []}
+        if c_id is not None:
+            current["comments"].append({"id": c_id, "user": c_user, "text": c_text,
+                                        "created_at": _iso(c_created)})
+    if current is not None:
+        yield json.dumps(current) + "\n"
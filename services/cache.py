@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """Thread-safe LRU bounded by total size (``sizeof`` per entry) and/or item count."""
+
+    def __init__(self, max_bytes=0, max_items=0, sizeof=None):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self._sizeof = sizeof or (lambda value: 1)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if self.max_bytes and size > self.max_bytes:
+                return  # never cache something that would flush everything else
+            self._data[key] = (value, size)
+            self.size += size
+            while self._data and ((self.max_bytes and self.size > self.max_bytes)
+                                  or (self.max_items and len(self._data) > self.max_items)):
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self.size -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"items": len(self._data), "bytes": self.size, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,70 @@
+import functools
+import sqlite3
+import time
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Engine setup beyond what Flask-SQLAlchemy does: SQLite pragmas applied on
+# every new connection, and optional read routing to a "replica" bind.
+# Views decorated with @read_only send their SELECTs to the replica; any
+# write, flush or explicit bind still goes to the primary.
+REPLICA = "replica"
+_PIN_KEY = "_db_primary_until"
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and getattr(clause, "is_select", False)
+                and has_request_context() and g.get("_db_replica")):
+            replica = self._db.engines.get(REPLICA)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def read_only(view):
+    """Route the view's SELECTs to the replica, unless this client wrote recently."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # read-your-writes: right after a POST the replica may not have caught up yet
+        g._db_replica = time.time() >= session.get(_PIN_KEY, 0)
+        return view(*args, **kwargs)
+    return wrapper
+
+def _sqlite_pragmas(pragmas):
+    def on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cur.execute(f"PRAGMA {name}={value}")
+        cur.close()
+    return on_connect
+
+def init_app(app, db):
+    pragmas = app.config.get("SQLITE_PRAGMAS") or {}
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != "sqlite":
+                continue
+            extra = {"query_only": "ON"} if key == REPLICA else {}
+            if pragmas or extra:
+                event.listen(engine, "connect", _sqlite_pragmas({**pragmas, **extra}))
+
+    sticky = app.config.get("DB_REPLICA_STICKY_SECONDS", 5)
+    if REPLICA in app.config.get("SQLALCHEMY_BINDS", {}) and sticky:
+        @app.after_request
+        def _pin_to_primary(response):
+            if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+                session[_PIN_KEY] = time.time() + sticky
+            return response
+
+    @app.cli.command("replica-sync")
+    def replica_sync():
+        """Copy the primary SQLite database onto the SQLite replica (local testing)."""
+        primary, replica = db.engines[None], db.engines.get(REPLICA)
+        if replica is None or {primary.dialect.name, replica.dialect.name} != {"sqlite"}:
+            raise SystemExit("replica-sync needs a SQLite primary and a SQLite DATABASE_REPLICA_URL.")
+        src, dst = sqlite3.connect(primary.url.database), sqlite3.connect(replica.url.database)
+        with dst:
+            src.backup(dst)
+        src.close()
+        dst.close()
+        print(f"Copied {primary.url.database} -> {replica.url.database}")
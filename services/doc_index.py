@@ -0,0 +1,51 @@
+import base64
+import datetime as dt
+from sqlalchemy import and_, or_, exists
+from models import Document, DocumentShare
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Cursor = (updated_at, id) of the last row on the previous page, newest first.
+def encode_cursor(doc) -> str:
+    raw = f"{doc.updated_at.isoformat()}|{doc.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, doc_id = raw.rsplit("|", 1)
+        doc_id = int(doc_id)
+        if not 0 <= doc_id < 2 ** 63:
+            return None
+        return dt.datetime.fromisoformat(ts), doc_id
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def access_filter(user):
+    if user is None:
+        return Document.is_public.is_(True)
+    # EXISTS instead of an outer join, so no DISTINCT is needed
+    shared = exists().where(DocumentShare.document_id == Document.id,
+                            DocumentShare.user_id == user.id)
+    return or_(Document.owner_id == user.id, shared)
+
+def page_documents(user, cursor=None, limit=PAGE_SIZE):
+    """One page of documents visible on the index for ``user`` (None = public only)."""
+    try:
+        limit = max(1, min(int(limit or PAGE_SIZE), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = PAGE_SIZE
+    q = Document.query.filter(access_filter(user), Document.deleted_at.is_(None))
+    after = decode_cursor(cursor)
+    if after:
+        ts, doc_id = after
+        q = q.filter(or_(Document.updated_at < ts,
+                         and_(Document.updated_at == ts, Document.id < doc_id)))
+    docs = (q.order_by(Document.updated_at.desc(), Document.id.desc())
+             .limit(limit + 1)
+             .all())
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
@@ -0,0 +1,109 @@
+import json
+import secrets
+import threading
+import time
+from collections import deque
+from flask import current_app
+
+# Per-document annotation events for the SSE stream (annotations_bp.events).
+# Each channel keeps the last EVENTS_LOG_SIZE events so a reconnecting client
+# that sends Last-Event-ID only gets what it missed; if that is older than the
+# log (or from before a restart) it gets a single "reset" and refetches.
+# The local broker only sees events published in this process; its ids are
+# "<epoch>:<seq>" with a random epoch per broker, so an id handed out by another
+# worker or before a restart never passes for one of ours.
+
+class EventBroker:
+    """No-op broker; subclass for a shared transport."""
+
+    def publish(self, channel, type, data): return None
+    def listen(self, channel, last_id=None, timeout=15.0):
+        """Yield (id, type, data) after the event with id ``last_id`` (a string this broker
+        handed out); None when idle for ``timeout`` seconds."""
+        while True:
+            time.sleep(timeout)
+            yield None
+
+class _Channel:
+    __slots__ = ("log", "seq", "cond")
+
+    def __init__(self, size):
+        self.log = deque(maxlen=size)
+        self.seq = 0
+        self.cond = threading.Condition()
+
+class LocalBroker(EventBroker):
+    def __init__(self, log_size=500):
+        self.log_size = log_size
+        self.epoch = secrets.token_hex(4)
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def _channel(self, name):
+        with self._lock:
+            ch = self._channels.get(name)
+            if ch is None:
+                ch = self._channels[name] = _Channel(self.log_size)
+            return ch
+
+    def publish(self, channel, type, data):
+        ch = self._channel(channel)
+        with ch.cond:
+            ch.seq += 1
+            ch.log.append((ch.seq, type, data))
+            ch.cond.notify_all()
+            return f"{self.epoch}:{ch.seq}"
+
+    def _seq(self, last_id):
+        # -1 (always older than the log) for ids from another epoch or garbage
+        epoch, _, seq = str(last_id).partition(":")
+        return int(seq) if epoch == self.epoch and seq.isdigit() else -1
+
+    def listen(self, channel, last_id=None, timeout=15.0):
+        ch = self._channel(channel)
+        with ch.cond:
+            cursor = ch.seq if last_id is None else self._seq(last_id)
+        while True:
+            with ch.cond:
+                if cursor == ch.seq:
+                    ch.cond.wait(timeout)
+                oldest = ch.log[0][0] if ch.log else ch.seq + 1
+                if cursor > ch.seq or cursor < oldest - 1:
+                    pending = [(ch.seq, "reset", {})]  # missed more than we kept
+                else:
+                    pending = [e for e in ch.log if e[0] > cursor]
+                cursor = ch.seq
+            if not pending:
+                yield None
+            for seq, type, data in pending:
+                yield f"{self.epoch}:{seq}", type, data
+
+BACKENDS = {"local": LocalBroker, "none": EventBroker}
+
+def init_app(app):
+    name = app.config.get("EVENTS_BACKEND", "local")
+    if name == "local":
+        app.extensions["events"] = LocalBroker(app.config.get("EVENTS_LOG_SIZE", 500))
+    else:
+        app.extensions["events"] = BACKENDS[name]()
+
+def backend() -> EventBroker:
+    return current_app.extensions["events"]
+
+def publish(doc_id, type, data):
+    """Call after the write has committed."""
+    return backend().publish(doc_id, type, data)
+
+def stream(broker, doc_id, last_id, heartbeat=15.0, max_seconds=300.0):
+    """text/event-stream body; ends after ``max_seconds`` so workers are not held forever
+    (EventSource reconnects with Last-Event-ID)."""
+    deadline = time.monotonic() + max_seconds
+    yield "retry: 2000\n\n"
+    for event in broker.listen(doc_id, last_id, timeout=heartbeat):
+        if event is None:
+            yield ": keepalive\n\n"
+        else:
+            event_id, type, data = event
+            yield f"id: {event_id}\nevent: {type}\ndata: {json.dumps(data)}\n\n"
+        if time.monotonic() >= deadline:
+            return
@@ -0,0 +1,21 @@
+import json
+from flask import current_app
+from services import metrics
+try:
+    import orjson
+except ImportError:  # in requirements.txt; json keeps a broken install working
+    orjson = None
+
+# JSON bodies for the large, hot list endpoints (annotations), encoded with
+# orjson. Keys are sorted like Flask's jsonify, so the decoded output is the
+# same as jsonify's; only whitespace and escaping differ.
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+def response(obj, status=200):
+    started = metrics.clock()
+    resp = current_app.response_class(dumps(obj), status=status, mimetype="application/json")
+    metrics.observe_json(started)
+    return resp
@@ -0,0 +1,108 @@
+import time
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+from models import db, User
+from services.cache import LRUCache
+from services.database import RoutingSession
+
+# Flask-Login's user_loader runs on every authenticated request. It now reads
+# a small identity record (id, username) from a pluggable cache and returns
+# a detached Identity, so most requests never query the users table.
+_counts = {"saved": 0, "loaded": 0}
+
+class Identity(UserMixin):
+    """What views need of the logged-in user; not bound to any session."""
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    def __repr__(self):
+        return f"<Identity {self.id} {self.username!r}>"
+
+class IdentityBackend:
+    """No caching; subclass for a shared store (values are plain dicts)."""
+
+    def get(self, uid): return None
+    def set(self, uid, record): pass
+    def delete(self, uid): pass
+    def stats(self): return {}
+
+class LocalBackend(IdentityBackend):
+    def __init__(self, ttl=300, max_items=10000):
+        self.ttl = ttl
+        self._lru = LRUCache(max_items=max_items)
+
+    def get(self, uid):
+        hit = self._lru.get(uid)
+        if hit is None:
+            return None
+        expires, record = hit
+        if expires < time.monotonic():
+            self._lru.pop(uid)
+            return None
+        return record
+
+    def set(self, uid, record):
+        self._lru.put(uid, (time.monotonic() + self.ttl, record))
+
+    def delete(self, uid):
+        self._lru.pop(uid)
+
+    def stats(self):
+        return self._lru.stats()
+
+BACKENDS = {"local": LocalBackend, "none": IdentityBackend}
+
+def init_app(app):
+    name = app.config.get("IDENTITY_CACHE", "local")
+    if name == "local":
+        app.extensions["identity"] = LocalBackend(app.config.get("IDENTITY_CACHE_TTL", 300),
+                                                  app.config.get("IDENTITY_CACHE_ITEMS", 10000))
+    else:
+        app.extensions["identity"] = BACKENDS[name]()
+
+def backend() -> IdentityBackend:
+    return current_app.extensions["identity"]
+
+def load(uid):
+    record = backend().get(uid)
+    if record is not None:
+        _counts["saved"] += 1
+        return Identity(**record)
+    row = db.session.execute(select(User.id, User.username).where(User.id == uid)).first()
+    if row is None:
+        return None
+    _counts["loaded"] += 1
+    record = {"id": row.id, "username": row.username}
+    backend().set(uid, record)
+    return Identity(**record)
+
+def forget(uid):
+    backend().delete(uid)
+
+def stats():
+    return {"saved_lookups": _counts["saved"], "db_lookups": _counts["loaded"], **backend().stats()}
+
+# Any insert/update/delete of a User (register, password or name change,
+# share-created accounts) drops its entry once the transaction commits.
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("_identity_changed", set()).add(target.id)
+
+@event.listens_for(RoutingSession, "after_commit")
+def _forget_changed(session):
+    changed = session.info.pop("_identity_changed", ())
+    if changed and has_app_context() and "identity" in current_app.extensions:
+        for uid in changed:
+            forget(uid)
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def _discard_changed(session, previous_transaction):
+    session.info.pop("_identity_changed", None)
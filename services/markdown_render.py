@@ -1,7 +1,9 @@
 import re
+import html as htmllib
 import bleach
 from bleach.css_sanitizer import CSSSanitizer
 import markdown2
+from services import metrics, render_cache
 
 ALLOWED_TAGS = bleach.sanitizer.ALLOWED_TAGS.union({
     "p","span","div","pre","code","hr","br","em","strong",
@@ -10,12 +12,85 @@ ALLOWED_TAGS = bleach.sanitizer.ALLOWED_TAGS.union({
 })
 ALLOWED_ATTRS = {"*": ["class", "id", "style"]}
 CSS_SAN = CSSSanitizer()
+EXTRAS = ["fenced-code-blocks","tables","strike","footnotes","wiki-tables"]
+# any change to the renderer config yields new cache keys, so stale entries are never served
+CONFIG_FINGERPRINT = render_cache.fingerprint(EXTRAS, ALLOWED_TAGS, ALLOWED_ATTRS, CSS_SAN)
 _ws = re.compile(r"\s+")
+_tag = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9]*)[^>]*>")
+_heading_inner = re.compile(r"<h[1-6][^>]*>(.*?)</h[1-6]>", re.S)
+_VOID = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+SECTION_TAGS = {"h1", "h2", "h3"}
 
-def render(md_text: str) -> tuple[str, str]:
-    html = markdown2.markdown(md_text or "", extras=[
-        "fenced-code-blocks","tables","strike","footnotes","wiki-tables"
-    ])
+def _strip(html: str) -> str:
+    return bleach.clean(html, tags=[], strip=True)
+
+def _render(md_text: str) -> tuple[str, str]:
+    html = markdown2.markdown(md_text, extras=EXTRAS)
     safe = bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS, css_sanitizer=CSS_SAN)
-    plain = _ws.sub(" ", bleach.clean(safe, tags=[], strip=True)).strip()
+    plain = _ws.sub(" ", _strip(safe)).strip()
     return safe, plain
+
+def split_sections(html: str, plain: str) -> list[dict]:
+    """Section table for ``html``: split before every top-level h1-h3.
+
+    Each entry has the heading ``level``/``title`` (0/"" for text before the
+    first heading), its ``html`` [start, end) slice and the [start, end) range
+    it covers in ``plain``, so annotation offsets stay document-global.
+    """
+    starts, depth = [0], 0
+    for m in _tag.finditer(html):
+        name = m.group(2).lower()
+        if name in _VOID:
+            continue
+        if m.group(1):
+            depth = max(depth - 1, 0)
+            continue
+        if depth == 0 and name in SECTION_TAGS and m.start() > 0:
+            starts.append(m.start())
+        depth += 1
+    bounds = list(zip(starts, starts[1:] + [len(html)]))
+
+    # plain offsets: collapse whitespace chunk by chunk, as render() does for the whole text
+    pieces, plain_starts, total, prev_space = [], [], 0, False
+    for a, b in bounds:
+        chunk = _ws.sub(" ", _strip(html[a:b]))
+        if chunk.startswith(" ") and (prev_space or total == 0):
+            chunk = chunk[1:]
+        plain_starts.append(total)
+        pieces.append(chunk)
+        total += len(chunk)
+        if chunk:
+            prev_space = chunk.endswith(" ")
+    if "".join(pieces).rstrip(" ") != plain:
+        bounds, plain_starts = [(0, len(html))], [0]  # never hand out offsets that disagree with plain
+
+    sections = []
+    for i, (a, b) in enumerate(bounds):
+        if not html[a:b].strip():
+            continue
+        p_end = plain_starts[i + 1] if i + 1 < len(bounds) else len(plain)
+        m = _heading_inner.match(html, a)
+        title = _ws.sub(" ", htmllib.unescape(re.sub(r"<[^>]+>", "", m.group(1)))).strip() if m else ""
+        sections.append({"level": int(html[a + 2]) if m else 0, "title": title,
+                         "html": [a, b], "plain": [plain_starts[i], min(p_end, len(plain))]})
+    return sections
+
+def render_document(md_text: str) -> tuple[str, str, list]:
+    """(html, plain, sections) for ``md_text``, served from the render cache when possible."""
+    md_text = md_text or ""
+    key = render_cache.key_for(md_text, CONFIG_FINGERPRINT)
+    hit = render_cache.get(key)
+    if hit is not None:
+        if hit[2] is None:  # cached before section tables existed
+            hit = (hit[0], hit[1], split_sections(hit[0], hit[1]))
+        return hit
+    started = metrics.clock()
+    html, plain = _render(md_text)
+    sections = split_sections(html, plain)
+    metrics.observe_render(started)
+    render_cache.put(key, html, plain, sections)
+    return html, plain, sections
+
+def render(md_text: str) -> tuple[str, str]:
+    html, plain, _ = render_document(md_text)
+    return html, plain
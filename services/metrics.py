@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, abort, g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# In-process request/SQL/render instrumentation, exposed in the Prometheus text
+# format on /metrics. Nothing is hooked up unless METRICS_ENABLED is set; the
+# only cost left when disabled is the `enabled` check in render_document.
+# Counters are per worker process, so scrape each worker (or run one).
+log = logging.getLogger(__name__)
+enabled = False
+_slow_query_s = 0.2
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in sorted(items)]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 2)
+            row[i] += 1
+            row[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        out = []
+        for labels, row in sorted(items):
+            total = 0
+            for le, n in zip(self.buckets + ("+Inf",), row):
+                total += n
+                le_label = 'le="%s"' % le
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le_label)} {total}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {row[-1]:.6f}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {total}")
+        return out
+
+REQUEST_SECONDS = Histogram("app_request_duration_seconds", "Request latency by endpoint.",
+                            ("endpoint", "method", "status"))
+REQUEST_SQL_STATEMENTS = Histogram("app_request_sql_statements", "SQL statements executed per request.",
+                                   ("endpoint",), COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram("app_request_sql_seconds", "Time spent in SQL per request.", ("endpoint",))
+JSON_SECONDS = Histogram("app_json_serialize_seconds", "Time spent encoding JSON responses.", ("endpoint",))
+RENDER_SECONDS = Histogram("app_markdown_render_seconds", "Markdown render time on render-cache misses.")
+SLOW_QUERIES = Counter("app_sql_slow_queries_total", "SQL statements slower than METRICS_SLOW_QUERY_MS.")
+REGISTRY = [REQUEST_SECONDS, REQUEST_SQL_STATEMENTS, REQUEST_SQL_SECONDS, JSON_SECONDS, RENDER_SECONDS,
+            SLOW_QUERIES]
+
+def clock():
+    """perf_counter() when metrics are on, else None (pairs with observe_render)."""
+    return time.perf_counter() if enabled else None
+
+def observe_render(started):
+    if started is not None:
+        RENDER_SECONDS.observe(time.perf_counter() - started)
+
+def observe_json(started):
+    # bodies encoded outside the JSON provider (services.fast_json)
+    if started is not None and has_request_context():
+        JSON_SECONDS.observe(time.perf_counter() - started, _endpoint())
+
+def _endpoint():
+    return request.endpoint or "unmatched"
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_metrics_t0", []).append(time.perf_counter())
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["_metrics_t0"].pop()
+    if elapsed >= _slow_query_s:
+        SLOW_QUERIES.inc()
+        log.warning("slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split())[:500])
+    if has_request_context():
+        acc = g.get("_metrics_sql")
+        if acc is not None:
+            acc[0] += 1
+            acc[1] += elapsed
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        t = time.perf_counter()
+        resp = super().response(*args, **kwargs)
+        if has_request_context():
+            JSON_SECONDS.observe(time.perf_counter() - t, _endpoint())
+        return resp
+
+def _cache_gauges():
+    from services import anchor_index, annotation_cache, identity, render_cache
+    by_key = {}
+    for cache, stats in (("render", render_cache.stats()), ("annotations", annotation_cache.stats()),
+                         ("identity", identity.stats()), ("anchors", anchor_index.stats())):
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                by_key.setdefault(key, []).append(f'app_cache_{key}{{cache="{cache}"}} {value}')
+    lines = []
+    for key, samples in sorted(by_key.items()):
+        lines.append(f"# TYPE app_cache_{key} gauge")
+        lines.extend(samples)
+    return lines
+
+def render_text():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    lines.extend(_cache_gauges())
+    return "\n".join(lines) + "\n"
+
+def init_app(app):
+    global enabled, _slow_query_s
+    if not app.config.get("METRICS_ENABLED"):
+        return
+    enabled = True
+    _slow_query_s = app.config.get("METRICS_SLOW_QUERY_MS", 200) / 1000
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor):
+        # on the Engine class, so replica/bind engines are counted too
+        event.listen(Engine, "before_cursor_execute", _before_cursor)
+        event.listen(Engine, "after_cursor_execute", _after_cursor)
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_t0 = time.perf_counter()
+        g._metrics_sql = [0, 0.0]
+
+    @app.after_request
+    def _record(response):
+        t0 = g.pop("_metrics_t0", None)
+        if t0 is not None:
+            endpoint = _endpoint()
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint, request.method, response.status_code)
+            count, seconds = g.pop("_metrics_sql", (0, 0.0))
+            REQUEST_SQL_STATEMENTS.observe(count, endpoint)
+            REQUEST_SQL_SECONDS.observe(seconds, endpoint)
+        return response
+
+    token = app.config.get("METRICS_TOKEN")
+
+    @app.get("/metrics")
+    def metrics():
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            abort(401)
+        return Response(render_text(), mimetype="text/plain; version=0.0.4")
@@ -1,12 +1,58 @@
-from models import DocumentShare, ROLE_ORDER
+from flask import g, has_app_context
+from sqlalchemy import select
+from models import db, DocumentShare, ROLE_ORDER, ROLE_OWNER
+
+# Roles are memoized per request on flask.g as {(user_id, doc_id): role}, so
+# can_view/can_edit/can_annotate on the same document cost one query in total.
+def _memo():
+    if not has_app_context():
+        return None
+    memo = g.get("_doc_roles")
+    if memo is None:
+        memo = g._doc_roles = {}
+    return memo
+
+def roles_for(docs, user):
+    """Map doc id -> role of ``user`` (None if no access) with one query for all uncached docs."""
+    if user is None:
+        return {d.id: None for d in docs}
+    memo = _memo()
+    out, missing = {}, []
+    for d in docs:
+        if d.deleted_at is not None:
+            out[d.id] = None
+        elif d.owner_id == user.id:
+            out[d.id] = ROLE_OWNER
+        elif memo is not None and (user.id, d.id) in memo:
+            out[d.id] = memo[(user.id, d.id)]
+        else:
+            missing.append(d.id)
+    for i in range(0, len(missing), 500):
+        chunk = missing[i:i + 500]
+        found = dict(db.session.execute(
+            select(DocumentShare.document_id, DocumentShare.role)
+            .where(DocumentShare.user_id == user.id, DocumentShare.document_id.in_(chunk))
+        ).all())
+        for doc_id in chunk:
+            out[doc_id] = found.get(doc_id)
+            if memo is not None:
+                memo[(user.id, doc_id)] = out[doc_id]
+    return out
+
+def forget_roles(doc_id=None):
+    memo = _memo()
+    if not memo:
+        return
+    if doc_id is None:
+        memo.clear()
+    else:
+        for key in [k for k in memo if k[1] == doc_id]:
+            del memo[key]
 
 def user_role_for(doc, user):
     if user is None:
         return None
-    if doc.owner_id == user.id:
-        return "owner"
-    share = DocumentShare.query.filter_by(document_id=doc.id, user_id=user.id).first()
-    return share.role if share else None
+    return roles_for([doc], user)[doc.id]
 
 def can_view(doc, user):
     return doc.is_public or user_role_for(doc, user) is not None
@@ -17,4 +63,4 @@ def can_edit(doc, user):
 
 def can_annotate(doc, user):
     role = user_role_for(doc, user)
-    return role is not None and ROLE_ORDER[role] >= ROLE_ORDER["annotator"]
\ No newline at end of file
+    return role is not None and ROLE_ORDER[role] >= ROLE_ORDER["annotator"]
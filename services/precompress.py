@@ -0,0 +1,29 @@
+import gzip
+try:
+    import brotli
+except ImportError:  # in requirements.txt; without it only gzip is stored
+    brotli = None
+
+# Compressed copies of a version's rendered_html, made once when the version
+# is rendered and served as-is by docs.version_content. A version's html never
+# changes, so neither do these; versions compacted to deltas drop them.
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9  # 11 is ~3% smaller but ~70x slower, and this runs on every save
+COLUMNS = {"br": "html_br", "gzip": "html_gzip"}
+
+def compress(html, encoding, fast=False):
+    data = (html or "").encode("utf-8")
+    if encoding == "br":
+        return brotli.compress(data, quality=5 if fast else BROTLI_QUALITY)
+    return gzip.compress(data, 6 if fast else GZIP_LEVEL, mtime=0)  # mtime=0: same html, same bytes
+
+def store(version, html):
+    version.html_gzip = compress(html, "gzip")
+    version.html_br = compress(html, "br") if brotli else None
+
+def choose(accept_encodings):
+    """The stored encoding to send for a request's Accept-Encoding, or None."""
+    for name in ("br", "gzip") if brotli else ("gzip",):
+        if accept_encodings[name]:
+            return name
+    return None
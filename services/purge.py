@@ -0,0 +1,103 @@
+import datetime as dt
+import logging
+import secrets
+import threading
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+from models import db, Document, DocumentVersion, DocumentShare, Annotation, AnnotationComment
+from services import search
+
+# Set-based deletes in dependency order (comments -> annotations -> versions
+# -> document) instead of the ORM cascade, which loads every child row first.
+# Documents with more than PURGE_INLINE_MAX_ROWS annotations are hidden in the
+# request (deleted_at, no shares, new share token) and emptied in chunks by a
+# background thread; `flask purge-deleted` finishes any that were interrupted.
+log = logging.getLogger(__name__)
+
+def delete_annotations(ids):
+    """Delete annotations and their comments, in the caller's transaction."""
+    ids = list(ids)
+    if not ids:
+        return
+    db.session.execute(delete(AnnotationComment).where(AnnotationComment.annotation_id.in_(ids)))
+    db.session.execute(delete(Annotation).where(Annotation.id.in_(ids)))
+
+def _version_ids(doc_id):
+    return select(DocumentVersion.id).where(DocumentVersion.document_id == doc_id).scalar_subquery()
+
+def _delete_rows(doc_id):
+    versions = _version_ids(doc_id)
+    anns = select(Annotation.id).where(Annotation.version_id.in_(versions)).scalar_subquery()
+    db.session.execute(delete(AnnotationComment).where(AnnotationComment.annotation_id.in_(anns)))
+    db.session.execute(delete(Annotation).where(Annotation.version_id.in_(versions)))
+    _delete_versions(doc_id)
+
+def _delete_versions(doc_id):
+    # deltas point at another version of the same document; drop those references first
+    db.session.execute(update(DocumentVersion).where(DocumentVersion.document_id == doc_id)
+                       .values(base_version_id=None))
+    db.session.execute(delete(DocumentVersion).where(DocumentVersion.document_id == doc_id))
+    db.session.execute(delete(DocumentShare).where(DocumentShare.document_id == doc_id))
+    db.session.execute(delete(Document).where(Document.id == doc_id))
+
+def delete_document(doc):
+    """Delete ``doc`` and everything under it and commit. Returns False if the
+    rows are being removed in the background (the document is already hidden)."""
+    doc_id = doc.id
+    search.backend().remove(doc_id)
+    count = db.session.scalar(select(func.count(Annotation.id))
+                              .where(Annotation.version_id.in_(_version_ids(doc_id))))
+    inline = count <= current_app.config.get("PURGE_INLINE_MAX_ROWS", 5000)
+    if inline:
+        _delete_rows(doc_id)
+    else:
+        doc.deleted_at = dt.datetime.utcnow()
+        doc.is_public = False
+        doc.share_token = secrets.token_hex(16)  # revokes old links (views compare against it)
+        db.session.execute(delete(DocumentShare).where(DocumentShare.document_id == doc_id))
+    db.session.commit()
+    if not inline:
+        schedule(doc_id)
+    return inline
+
+def schedule(doc_id):
+    app = current_app._get_current_object()
+    thread = threading.Thread(target=_run, args=(app, doc_id), name=f"purge-{doc_id}", daemon=True)
+    thread.start()
+    return thread
+
+def _run(app, doc_id):
+    with app.app_context():
+        try:
+            purge(doc_id, app.config.get("PURGE_CHUNK_SIZE", 1000))
+        except Exception:
+            log.exception("purging document %s failed", doc_id)
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+def purge(doc_id, chunk_size=1000):
+    """Remove a hidden document's rows, one short transaction per chunk of annotations."""
+    removed = 0
+    while True:
+        ids = db.session.scalars(select(Annotation.id)
+                                 .where(Annotation.version_id.in_(_version_ids(doc_id)))
+                                 .limit(chunk_size)).all()
+        if not ids:
+            break
+        delete_annotations(ids)
+        db.session.commit()
+        removed += len(ids)
+    _delete_versions(doc_id)
+    db.session.commit()
+    log.info("purged document %s (%d annotations)", doc_id, removed)
+    return removed
+
+def init_app(app):
+    @app.cli.command("purge-deleted")
+    def purge_deleted():
+        """Finish removing documents whose background purge was interrupted."""
+        doc_ids = db.session.scalars(select(Document.id).where(Document.deleted_at.is_not(None))).all()
+        for doc_id in doc_ids:
+            purge(doc_id, app.config.get("PURGE_CHUNK_SIZE", 1000))
+        print(f"Purged {len(doc_ids)} documents.")
@@ -0,0 +1,84 @@
+from sqlalchemy import select, insert, update
+from models import db, Annotation, AnnotationComment
+from services.version_store import encode
+
+def matching_blocks(old: str, new: str) -> list:
+    """(old_start, old_end, new_start) runs of text shared by ``old`` and ``new``, in order."""
+    blocks, pos = [], 0
+    for op in encode(new, old):
+        if isinstance(op, list):
+            blocks.append((op[0], op[1], pos))
+            pos += op[1] - op[0]
+        else:
+            pos += len(op)
+    return blocks
+
+def _map_points(points, blocks, is_end):
+    # single sweep: points and blocks are both sorted by old offset
+    out, i, n = {}, 0, len(blocks)
+    for o in points:
+        while i < n and (blocks[i][1] < o if is_end else blocks[i][1] <= o):
+            i += 1
+        if i < n:
+            s, _, ns = blocks[i]
+            if (s < o) if is_end else (s <= o):
+                out[o] = ns + o - s
+                continue
+        out[o] = None
+    return out
+
+def carry_annotations(old_version_id, new_version_id, old_plain, new_plain):
+    """Copy annotations (with comments) of the old version onto the new one.
+
+    Offsets are mapped through one diff of the two page texts
+    (anchor_index.dom_text of each ``rendered_plain``), which they index;
+    annotations whose range no longer exists are flagged ``orphaned`` on the
+    old version. Runs inside the caller's transaction. Returns (carried, orphaned).
+    """
+    anns = db.session.execute(
+        select(Annotation.id, Annotation.user_id, Annotation.start_offset, Annotation.end_offset,
+               Annotation.color, Annotation.created_at, Annotation.updated_at)
+        .where(Annotation.version_id == old_version_id, Annotation.orphaned.is_(False))
+        .order_by(Annotation.id)
+    ).all()
+    if not anns:
+        return 0, 0
+
+    blocks = matching_blocks(old_plain or "", new_plain or "")
+    starts = _map_points(sorted({a.start_offset for a in anns}), blocks, is_end=False)
+    ends = _map_points(sorted({a.end_offset for a in anns}), blocks, is_end=True)
+
+    carried, carried_ids, orphan_ids = [], [], []
+    for a in anns:
+        s, e = starts[a.start_offset], ends[a.end_offset]
+        if s is None or e is None or e <= s:
+            orphan_ids.append(a.id)
+            continue
+        carried_ids.append(a.id)
+        carried.append({"version_id": new_version_id, "user_id": a.user_id,
+                        "start_offset": s, "end_offset": e, "anchor_text": new_plain[s:e],
+                        "color": a.color, "created_at": a.created_at, "updated_at": a.updated_at})
+
+    if carried:
+        new_ids = db.session.scalars(
+            insert(Annotation).returning(Annotation.id, sort_by_parameter_order=True), carried
+        ).all()
+        id_map = dict(zip(carried_ids, new_ids))
+        comments = db.session.execute(
+            select(AnnotationComment.annotation_id, AnnotationComment.user_id,
+                   AnnotationComment.text, AnnotationComment.created_at)
+            .join(Annotation, Annotation.id == AnnotationComment.annotation_id)
+            .where(Annotation.version_id == old_version_id)
+            .order_by(AnnotationComment.id)
+        ).all()
+        rows = [{"annotation_id": id_map[c.annotation_id], "user_id": c.user_id,
+                 "text": c.text, "created_at": c.created_at}
+                for c in comments if c.annotation_id in id_map]
+        if rows:
+            db.session.execute(insert(AnnotationComment), rows)
+
+    for i in range(0, len(orphan_ids), 500):
+        db.session.execute(update(Annotation)
+                           .where(Annotation.id.in_(orphan_ids[i:i + 500]))
+                           .values(orphaned=True))
+    return len(carried), len(orphan_ids)
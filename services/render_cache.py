@@ -0,0 +1,55 @@
+import hashlib
+import json
+from flask import current_app, has_app_context
+from services.cache import LRUCache
+
+# L1: in-process, evicted by the size of the cached (html, plain, sections).
+# L2: optional `render_cache` table, enabled with RENDER_CACHE_PERSIST.
+_lru = LRUCache(max_bytes=64 * 1024 * 1024, sizeof=lambda v: len(v[0]) + len(v[1]))
+_l2 = {"hits": 0, "misses": 0}
+
+def configure(config):
+    _lru.max_bytes = config.get("RENDER_CACHE_MAX_BYTES", _lru.max_bytes)
+
+def fingerprint(extras, tags, attrs, css_sanitizer=None) -> str:
+    css = sorted(getattr(css_sanitizer, "allowed_css_properties", ()) or ())
+    blob = json.dumps([sorted(extras), sorted(tags), {k: sorted(v) for k, v in attrs.items()}, css])
+    return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+def key_for(md_text: str, config_fingerprint: str) -> str:
+    h = hashlib.sha256(config_fingerprint.encode())
+    h.update(md_text.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+def _persist_enabled():
+    return has_app_context() and current_app.config.get("RENDER_CACHE_PERSIST", False)
+
+def get(key):
+    hit = _lru.get(key)
+    if hit is not None or not _persist_enabled():
+        return hit
+    from models import db, RenderCacheEntry
+    row = db.session.get(RenderCacheEntry, key)
+    if row is None:
+        _l2["misses"] += 1
+        return None
+    _l2["hits"] += 1
+    hit = (row.rendered_html, row.rendered_plain, row.sections)
+    _lru.put(key, hit)
+    return hit
+
+def put(key, html, plain, sections=None):
+    _lru.put(key, (html, plain, sections))
+    if _persist_enabled():
+        from models import db, RenderCacheEntry
+        # rides on the caller's transaction (create_doc / save_doc commit it)
+        db.session.merge(RenderCacheEntry(key=key, rendered_html=html, rendered_plain=plain,
+                                          sections=sections))
+
+def clear():
+    _lru.clear()
+
+def stats():
+    s = _lru.stats()
+    s["l2_hits"], s["l2_misses"] = _l2["hits"], _l2["misses"]
+    return s
@@ -0,0 +1,139 @@
+import logging
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from sqlalchemy import select
+from models import db, DocumentVersion, VERSION_READY, VERSION_RENDERING, VERSION_FAILED
+from services import anchor_index, precompress, render_cache, search, version_store
+from services.markdown_render import render_document, CONFIG_FINGERPRINT
+from services.reanchor import carry_annotations
+
+# Large saves are rendered in a process pool (markdown2 + bleach are CPU-bound
+# and hold the GIL); the version row waits in "rendering" until a pool
+# callback fills it in. Small documents keep the inline path.
+log = logging.getLogger(__name__)
+_pool = None
+_pool_lock = threading.Lock()
+# finished renders are saved by one writer thread, not in the executor's callback thread
+_done = queue.Queue()
+_writer = None
+
+def _executor(workers, broken=None):
+    global _pool
+    with _pool_lock:
+        if broken is not None and _pool is broken:
+            # a dead worker (OOM, kill) breaks the executor for good; start a new one
+            broken.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        if _pool is None:
+            # spawn: never fork a process that holds DB connections and threads
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def should_defer(md):
+    cfg = current_app.config
+    limit = cfg.get("RENDER_INLINE_MAX_BYTES", 256 * 1024)
+    # characters <= UTF-8 bytes, so only encode when the cheap check doesn't decide it
+    return cfg.get("RENDER_POOL_WORKERS", 0) > 0 and (len(md) >= limit or len(md.encode("utf-8")) >= limit)
+
+def finish(version, html, plain, sections):
+    """Fill in a version's rendering and run the post-save steps, in the caller's transaction."""
+    version.rendered_html, version.rendered_plain, version.sections = html, plain, sections
+    version.status = VERSION_READY
+    precompress.store(version, html)
+    db.session.flush()  # need version.id / document_id for the carried-over annotations
+    prev = (DocumentVersion.query
+            .filter(DocumentVersion.document_id == version.document_id,
+                    DocumentVersion.number < version.number,
+                    DocumentVersion.status == VERSION_READY)
+            .order_by(DocumentVersion.number.desc())
+            .first())
+    if prev:
+        # annotation offsets are in the page text, not the escaped rendered_plain
+        carry_annotations(prev.id, version.id, anchor_index.dom_text(prev.rendered_plain or ""),
+                          anchor_index.dom_text(plain or ""))
+        version_store.compact(prev, version)  # latest stays full; prev becomes a delta unless it's a snapshot
+    search.backend().index_document(version.document, version)
+
+def submit(version_id, md):
+    """Render ``md`` off-request for an already committed "rendering" version.
+
+    Returns the future, or None if the pool could not take the job (the caller
+    renders inline instead).
+    """
+    app = current_app._get_current_object()
+    workers = app.config["RENDER_POOL_WORKERS"]
+    _start_writer()
+    try:
+        pool = _executor(workers)
+        try:
+            future = pool.submit(render_document, md)
+        except BrokenProcessPool:
+            log.warning("render pool was broken; starting a new one")
+            future = _executor(workers, broken=pool).submit(render_document, md)
+    except Exception:
+        log.exception("could not submit version %s to the render pool", version_id)
+        return None
+    future.add_done_callback(lambda f: _done.put((app, version_id, md, f)))
+    return future
+
+def _start_writer():
+    global _writer
+    with _pool_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_results, name="render-results", daemon=True)
+            _writer.start()
+
+def _write_results():
+    while True:
+        app, version_id, md, future = _done.get()
+        try:
+            _complete(app, version_id, md, future)
+        except Exception:
+            log.exception("saving rendered version %s failed", version_id)
+
+def _complete(app, version_id, md, future):
+    with app.app_context():
+        version = db.session.get(DocumentVersion, version_id)
+        if version is None or version.status != VERSION_RENDERING:
+            return
+        try:
+            html, plain, sections = future.result()
+            render_cache.put(render_cache.key_for(md, CONFIG_FINGERPRINT), html, plain, sections)
+            finish(version, html, plain, sections)
+            db.session.commit()
+            anchor_index.for_version(version_id, plain)  # big text: build it here, not in a request
+        except Exception:
+            log.exception("rendering version %s failed", version_id)
+            db.session.rollback()
+            version = db.session.get(DocumentVersion, version_id)
+            if version is not None:
+                version.status = VERSION_FAILED
+                db.session.commit()
+        finally:
+            db.session.remove()
+
+def render_pending():
+    """Render inline every version left in "rendering" (e.g. by a restart). Returns the count."""
+    ids = db.session.scalars(select(DocumentVersion.id).where(DocumentVersion.status == VERSION_RENDERING)
+                             .order_by(DocumentVersion.id)).all()
+    for version_id in ids:
+        version = db.session.get(DocumentVersion, version_id)
+        try:
+            finish(version, *render_document(version.source_md or ""))
+            db.session.commit()
+        except Exception:
+            log.exception("rendering version %s failed", version_id)
+            db.session.rollback()
+            db.session.get(DocumentVersion, version_id).status = VERSION_FAILED
+            db.session.commit()
+    return len(ids)
+
+def init_app(app):
+    @app.cli.command("render-pending")
+    def render_pending_command():
+        """Finish versions whose pool render was lost (worker crash or restart)."""
+        print(f"Rendered {render_pending()} pending versions.")
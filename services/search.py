@@ -0,0 +1,122 @@
+import re
+from flask import current_app
+from sqlalchemy import select, text
+from models import db, Annotation, AnnotationComment, DocumentVersion, VERSION_READY
+from services.anchor_index import dom_text
+
+# Full-text search over each document's title, latest page text (rendered_plain
+# unescaped, as shown) and annotation comments. Backends are picked with
+# SEARCH_BACKEND ("auto" uses SQLite FTS5 on SQLite and disables search
+# elsewhere) and kept up to date incrementally by the write paths, inside their
+# own transactions.
+_word = re.compile(r"\w+", re.UNICODE)
+HL_OPEN, HL_CLOSE = "\x02", "\x03"
+
+class SearchBackend:
+    name = "none"
+
+    def index_document(self, doc, version): pass
+    def update_comments(self, doc_id, version_id): pass
+    def remove(self, doc_id): pass
+    def search(self, query, user, limit=20): return []
+
+class SqliteFtsBackend(SearchBackend):
+    name = "sqlite-fts5"
+    table = "doc_search"
+
+    def __init__(self):
+        self._ready = set()
+
+    def _ensure(self):
+        bind = db.engine.url.render_as_string()
+        if bind in self._ready:
+            return
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+            "USING fts5(title, body, comments, tokenize='unicode61 remove_diacritics 2')"))
+        self._ready.add(bind)
+
+    def _comments_text(self, version_id):
+        rows = db.session.scalars(
+            select(AnnotationComment.text)
+            .join(Annotation, Annotation.id == AnnotationComment.annotation_id)
+            .where(Annotation.version_id == version_id)
+        )
+        return "\n".join(rows)
+
+    def index_document(self, doc, version):
+        self._ensure()
+        db.session.execute(text(f"DELETE FROM {self.table} WHERE rowid = :id"), {"id": doc.id})
+        db.session.execute(
+            text(f"INSERT INTO {self.table} (rowid, title, body, comments) VALUES (:id, :title, :body, :comments)"),
+            {"id": doc.id, "title": doc.title or "", "body": dom_text(version.rendered_plain or ""),
+             "comments": self._comments_text(version.id)})
+
+    def update_comments(self, doc_id, version_id):
+        self._ensure()
+        db.session.execute(text(f"UPDATE {self.table} SET comments = :c WHERE rowid = :id"),
+                           {"c": self._comments_text(version_id), "id": doc_id})
+
+    def remove(self, doc_id):
+        self._ensure()
+        db.session.execute(text(f"DELETE FROM {self.table} WHERE rowid = :id"), {"id": doc_id})
+
+    def search(self, query, user, limit=20):
+        terms = _word.findall(query or "")
+        if not terms:
+            return []
+        self._ensure()
+        # quoted terms (no FTS syntax injection), prefix match on the last one
+        match = " ".join(f'"{t}"' for t in terms) + "*"
+        rows = db.session.execute(text(f"""
+            SELECT d.id, d.title,
+                   snippet({self.table}, -1, :o, :c, '…', 24) AS snip,
+                   bm25({self.table}, 10.0, 1.0, 2.0) AS rank
+            FROM {self.table} JOIN documents d ON d.id = {self.table}.rowid
+            WHERE {self.table} MATCH :match AND d.deleted_at IS NULL
+              AND (d.is_public = 1 OR d.owner_id = :uid OR EXISTS (
+                   SELECT 1 FROM document_shares s WHERE s.document_id = d.id AND s.user_id = :uid))
+            ORDER BY rank
+            LIMIT :limit"""),
+            {"o": HL_OPEN, "c": HL_CLOSE, "match": match,
+             "uid": user.id if user else -1, "limit": limit}).all()
+        return [dict(id=r.id, title=r.title, rank=r.rank, **_split_snippet(r.snip)) for r in rows]
+
+def _split_snippet(snip):
+    # strip highlight markers and report the matched ranges as offsets into the snippet
+    out, matches, start = [], [], None
+    for ch in snip or "":
+        if ch == HL_OPEN:
+            start = len(out)
+        elif ch == HL_CLOSE and start is not None:
+            matches.append([start, len(out)])
+            start = None
+        else:
+            out.append(ch)
+    return {"snippet": "".join(out), "matches": matches}
+
+BACKENDS = {"sqlite-fts5": SqliteFtsBackend, "none": SearchBackend}
+
+def init_app(app):
+    name = app.config.get("SEARCH_BACKEND", "auto")
+    if name == "auto":
+        uri = app.config.get("SQLALCHEMY_DATABASE_URI", "")
+        name = "sqlite-fts5" if uri.startswith("sqlite") else "none"
+    app.extensions["search"] = BACKENDS[name]()
+
+    @app.cli.command("search-reindex")
+    def search_reindex():
+        """Index the latest version of every document."""
+        from models import Document
+        n = 0
+        for doc in Document.query.filter(Document.deleted_at.is_(None)).yield_per(200):
+            version = (DocumentVersion.query.filter_by(document_id=doc.id, status=VERSION_READY)
+                       .order_by(DocumentVersion.number.desc()).first())
+            if version:
+                backend().index_document(doc, version)
+                n += 1
+        db.session.commit()
+        print(f"Indexed {n} documents.")
+
+def backend() -> SearchBackend:
+    return current_app.extensions["search"]
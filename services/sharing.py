@@ -0,0 +1,80 @@
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from models import db, User, DocumentShare, ROLE_OWNER, ROLE_EDITOR, ROLE_ANNOTATOR, ROLE_VIEWER
+
+# Share grants/revokes for many (username, role) pairs and documents in one
+# transaction: users resolved with one IN query per chunk, missing ones
+# created with one executemany, shares upserted on the (document_id, user_id)
+# unique constraint. Callers commit and then forget_roles() the documents.
+ROLES = {ROLE_OWNER, ROLE_EDITOR, ROLE_ANNOTATOR, ROLE_VIEWER}
+MAX_USERNAME = 80
+_shares = DocumentShare.__table__
+CHUNK_SIZE = 500
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def clean_username(name):
+    name = (name or "").strip() if isinstance(name, str) else ""
+    return name if 0 < len(name) <= MAX_USERNAME else None
+
+def user_ids(names, create=False):
+    """{username: id} for ``names``; with ``create``, missing users are added
+    without a usable password (as the single-share form always did)."""
+    found = {}
+    for chunk in _chunks(set(names)):
+        found.update(db.session.execute(select(User.username, User.id).where(User.username.in_(chunk))).all())
+    missing = [n for n in set(names) if n not in found] if create else []
+    if missing:
+        db.session.execute(insert(User.__table__), [{"username": n, "password_hash": ""} for n in missing])
+        for chunk in _chunks(missing):
+            found.update(db.session.execute(select(User.username, User.id).where(User.username.in_(chunk))).all())
+    return found
+
+def _upsert(dialect):
+    if dialect == "sqlite":
+        stmt = sqlite.insert(_shares)
+        return stmt.on_conflict_do_update(index_elements=["document_id", "user_id"],
+                                          set_={"role": stmt.excluded.role})
+    if dialect == "postgresql":
+        stmt = postgresql.insert(_shares)
+        return stmt.on_conflict_do_update(index_elements=["document_id", "user_id"],
+                                          set_={"role": stmt.excluded.role})
+    if dialect in ("mysql", "mariadb"):
+        stmt = mysql.insert(_shares)
+        return stmt.on_duplicate_key_update(role=stmt.inserted.role)
+    return None
+
+def grant(doc_ids, roles_by_user):
+    """Give each user id in ``roles_by_user`` its role on every document. Returns the row count."""
+    rows = [{"document_id": d, "user_id": u, "role": r} for d in doc_ids for u, r in roles_by_user.items()]
+    if not rows:
+        return 0
+    stmt = _upsert(db.session.get_bind().dialect.name)
+    if stmt is not None:
+        for chunk in _chunks(rows):
+            db.session.execute(stmt, chunk)
+        return len(rows)
+    # no native upsert: update what exists, insert the rest
+    for d in doc_ids:
+        existing = set(db.session.scalars(select(DocumentShare.user_id).where(
+            DocumentShare.document_id == d, DocumentShare.user_id.in_(list(roles_by_user)))))
+        for uid in existing:
+            db.session.execute(update(DocumentShare).where(DocumentShare.document_id == d,
+                                                          DocumentShare.user_id == uid)
+                               .values(role=roles_by_user[uid]))
+        new = [{"document_id": d, "user_id": u, "role": r} for u, r in roles_by_user.items() if u not in existing]
+        if new:
+            db.session.execute(insert(_shares), new)
+    return len(rows)
+
+def revoke(doc_ids, uids):
+    """Remove the shares of ``uids`` on ``doc_ids``. Returns the number of rows deleted."""
+    removed = 0
+    for chunk in _chunks(uids):
+        result = db.session.execute(delete(DocumentShare).where(DocumentShare.document_id.in_(list(doc_ids)),
+                                                                DocumentShare.user_id.in_(chunk)))
+        removed += result.rowcount
+    return removed
@@ -0,0 +1,89 @@
+import logging
+import os
+import threading
+import time
+from flask import request
+from jinja2 import FileSystemBytecodeCache
+
+# Cold-start helpers: Jinja bytecode cache, background cache warm-up and a
+# one-line report of where startup time went (imports / create_app phases /
+# first request). create_app records its phases in app.extensions["startup"].
+log = logging.getLogger(__name__)
+
+def from_cli():
+    # set by the `flask` command for every subcommand (db upgrade, run, ...)
+    return bool(os.environ.get("FLASK_RUN_FROM_CLI"))
+
+def use_bytecode_cache(app):
+    path = app.config.get("JINJA_BYTECODE_CACHE_DIR")
+    if not path:
+        return
+    os.makedirs(path, exist_ok=True)
+    # must be set before app.jinja_env is first touched
+    app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(path)}
+
+def install_report(app, phases):
+    app.extensions["startup"] = phases
+    if not app.config.get("STARTUP_REPORT"):
+        return
+    state = {"done": False}
+
+    @app.before_request
+    def _first_request_start():
+        if not state["done"]:
+            state["t0"] = time.perf_counter()
+
+    @app.after_request
+    def _first_request_end(response):
+        if not state["done"] and "t0" in state:
+            state["done"] = True
+            phases["first_request"] = time.perf_counter() - state["t0"]
+            app.logger.info("startup: %s (first request: %s %s)", format_phases(phases),
+                            request.method, request.path)
+        return response
+
+def format_phases(phases):
+    return ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in phases.items())
+
+def warm_up(app, limit=None):
+    """Fill the render, annotation and identity caches for the most recently
+    updated documents in a daemon thread. Returns the thread (or None)."""
+    limit = app.config.get("WARMUP_DOCUMENTS", 0) if limit is None else limit
+    if limit <= 0:
+        return None
+    thread = threading.Thread(target=_warm, args=(app, limit), name="cache-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def _warm(app, limit):
+    from sqlalchemy import select
+    from models import db, Document, DocumentVersion, DocumentShare, VERSION_READY
+    from services import annotation_cache, identity
+    from services.markdown_render import render_document
+
+    t0 = time.perf_counter()
+    with app.app_context():
+        try:
+            # no view counter exists, so recency stands in for "most viewed"
+            doc_ids = db.session.scalars(select(Document.id).order_by(Document.updated_at.desc(),
+                                                                      Document.id.desc()).limit(limit)).all()
+            user_ids = set(db.session.scalars(select(Document.owner_id).where(Document.id.in_(doc_ids))))
+            user_ids |= set(db.session.scalars(select(DocumentShare.user_id)
+                                               .where(DocumentShare.document_id.in_(doc_ids))))
+            warmed = 0
+            for doc_id in doc_ids:
+                version = (DocumentVersion.query.filter_by(document_id=doc_id, status=VERSION_READY)
+                           .order_by(DocumentVersion.number.desc()).first())
+                if version is None:
+                    continue
+                render_document(version.source_md)
+                annotation_cache.shared_payload(version.id, version.ann_rev)
+                warmed += 1
+            for uid in user_ids:
+                identity.load(uid)
+            log.info("cache warm-up: %d documents, %d users in %.0fms", warmed, len(user_ids),
+                     (time.perf_counter() - t0) * 1000)
+        except Exception:
+            log.exception("cache warm-up failed")
+        finally:
+            db.session.remove()
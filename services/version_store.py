@@ -0,0 +1,90 @@
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+from flask import current_app, has_app_context
+
+# Older DocumentVersions are stored as reverse deltas against the next newer
+# version; every VERSION_SNAPSHOT_EVERY-th version (and always the latest) keeps
+# its full text, so reconstruction walks at most N-1 deltas and the newest
+# version is read straight from its columns.
+FIELDS = ("source_md", "rendered_html", "rendered_plain")
+_tok = re.compile(r"\S+\s*|\s+")
+
+def snapshot_every():
+    if has_app_context():
+        return current_app.config.get("VERSION_SNAPSHOT_EVERY", 10)
+    return 10
+
+def is_snapshot(version):
+    every = snapshot_every()
+    return every <= 1 or (version.number - 1) % every == 0
+
+def _tokens(text, base_off):
+    toks, offs = [], []
+    for m in _tok.finditer(text):
+        toks.append(m.group())
+        offs.append(base_off + m.start())
+    offs.append(base_off + len(text))
+    return toks, offs
+
+def encode(target: str, base: str) -> list:
+    # ops: [start, end] copies base[start:end], a str is inserted verbatim
+    n = min(len(target), len(base))
+    pre = 0
+    while pre < n and target[pre] == base[pre]:
+        pre += 1
+    suf = 0
+    while suf < n - pre and target[-1 - suf] == base[-1 - suf]:
+        suf += 1
+    ops = [[0, pre]] if pre else []
+    b_mid, t_mid = base[pre:len(base) - suf], target[pre:len(target) - suf]
+    b_toks, b_offs = _tokens(b_mid, pre)
+    t_toks, _ = _tokens(t_mid, 0)
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, b_toks, t_toks).get_opcodes():
+        if tag == "equal":
+            if ops and isinstance(ops[-1], list) and ops[-1][1] == b_offs[i1]:
+                ops[-1][1] = b_offs[i2]
+            else:
+                ops.append([b_offs[i1], b_offs[i2]])
+        elif j2 > j1:
+            text = "".join(t_toks[j1:j2])
+            if ops and isinstance(ops[-1], str):
+                ops[-1] += text
+            else:
+                ops.append(text)
+    if suf:
+        start = len(base) - suf
+        if ops and isinstance(ops[-1], list) and ops[-1][1] == start:
+            ops[-1][1] = len(base)
+        else:
+            ops.append([start, len(base)])
+    return ops
+
+def decode(ops: list, base: str) -> str:
+    return "".join(base[op[0]:op[1]] if isinstance(op, list) else op for op in ops)
+
+def compact(version, newer):
+    """Replace ``version``'s full text by a delta against ``newer`` (unless it is a snapshot)."""
+    if version.delta is not None or is_snapshot(version):
+        return False
+    values = {f: getattr(version, f) or "" for f in FIELDS}
+    ops = {f: encode(values[f], getattr(newer, f) or "") for f in FIELDS}
+    blob = zlib.compress(json.dumps(ops, separators=(",", ":")).encode(), 6)
+    if len(blob) >= sum(len(v) for v in values.values()):
+        return False  # rewritten from scratch; a delta would not save anything
+    version.delta = blob
+    version.base_version = newer
+    version._materialized = values  # callers in this request still see the text
+    version._source_md = version._rendered_html = version._rendered_plain = None
+    version.html_gzip = version.html_br = None  # rarely viewed; version_content compresses on demand
+    return True
+
+def materialize(version) -> dict:
+    cached = getattr(version, "_materialized", None)
+    if cached is None:
+        base = version.base_version
+        ops = json.loads(zlib.decompress(version.delta))
+        cached = {f: decode(ops[f], getattr(base, f) or "") for f in FIELDS}
+        version._materialized = cached
+    return cached
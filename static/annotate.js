@@ -21,6 +21,8 @@
 
   // Track what we've already drawn to prevent duplicates
   const RENDERED_IDS = new Set();
+  // Highlights waiting for a section that is still being loaded: id -> arguments
+  const DEFERRED = new Map();
 
   // ---- Helpers (DOM/list) ----
   function escapeHTML(s){ return (s||"").replace(/[&<>"]/g, c=>({"&":"&amp;","<":"&lt;",">":"&gt;","\"":"&quot;"}[c])); }
@@ -37,7 +39,7 @@
     const commentsBlock = a.comments && a.comments.length
       ? a.comments.map(c=>`<div class="muted">${escapeHTML(c.user)}: ${escapeHTML(c.text)}</div>`).join('')
       : '';
-    return `<div class="item" data-id="${a.id}" data-can-delete="${a.can_delete ? '1' : '0'}">
+    return `<div class="item" data-id="${a.id}" data-start="${a.start ?? ''}" data-can-delete="${a.can_delete ? '1' : '0'}">
       <div>
         <strong>${escapeHTML(a.user)}</strong> — <em>${escapeHTML(a.anchor.slice(0,64))}${a.anchor.length>64?'…':''}</em>
         ${del}
@@ -73,18 +75,79 @@
     }
   }
 
+  function removeAnnotation(id){
+    const item = listEl ? listEl.querySelector(`.item[data-id="${id}"]`) : null;
+    if (item) item.remove();
+    document.querySelectorAll(`mark.ann[data-id="${id}"]`).forEach(mark => {
+      const p = mark.parentNode; while (mark.firstChild) p.insertBefore(mark.firstChild, mark); p.removeChild(mark);
+    });
+    RENDERED_IDS.delete(String(id));
+    DEFERRED.delete(String(id));
+    document.dispatchEvent(new CustomEvent('annotations:updated'));
+  }
+
   // ---- Load and render existing annotations ----
-  fetch(`/api/documents/${DOC_ID}/annotations`)
-    .then(r=>r.json())
-    .then(anns=>{
-      const uniq = dedupeById(anns);
-      uniq.forEach(a=>{
-        highlightByNormalizedRange(a.start, a.end, a.color, a.id, a.content || a.anchor);
-        ensureSingleListItem(a);
-      });
-      cleanupDuplicateMarks();
-    })
-    .catch(e=>console.error('Failed to load annotations:', e));
+  let listLoaded = false;
+  function loadAnnotations(){
+    fetch(docEl.dataset.annotationsUrl || `/api/documents/${DOC_ID}/annotations`)
+      .then(r=>r.json())
+      .then(anns=>{
+        const uniq = dedupeById(anns);
+        uniq.forEach(a=>{
+          highlightByNormalizedRange(a.start, a.end, a.color, a.id, a.content || a.anchor);
+          ensureSingleListItem(a);
+        });
+        cleanupDuplicateMarks();
+        listLoaded = true;
+        pendingEvents.splice(0).forEach(([type, d]) => applyEvent(type, d));
+      })
+      .catch(e=>console.error('Failed to load annotations:', e));
+  }
+
+  // ---- Live updates from collaborators (server-sent events) ----
+  // Subscribed before the first list fetch; anything that arrives meanwhile
+  // is applied once the list is drawn (creates/deletes are idempotent).
+  const pendingEvents = [];
+  function applyEvent(type, d){
+    if (d.version_id && typeof VERSION_ID !== 'undefined' && VERSION_ID && d.version_id !== VERSION_ID) return;
+    if (type === 'annotation.created'){
+      const me = typeof ME_ID !== 'undefined' && d.user_id === ME_ID;
+      const a = Object.assign({}, d, {can_delete: me || (typeof CAN_EDIT !== 'undefined' && CAN_EDIT)});
+      highlightByNormalizedRange(a.start, a.end, a.color, a.id, a.content || a.anchor);
+      ensureSingleListItem(a);
+    } else if (type === 'annotation.deleted'){
+      removeAnnotation(d.id);
+    } else if (type === 'comment.created'){
+      const item = listEl ? listEl.querySelector(`.item[data-id="${d.annotation_id}"]`) : null;
+      if (item) item.insertAdjacentHTML('beforeend',
+        `<div class="muted">${escapeHTML(d.comment.user)}: ${escapeHTML(d.comment.text)}</div>`);
+    } else if (type === 'reset'){
+      // we missed more than the server keeps: redraw from the full list
+      [...RENDERED_IDS].forEach(removeAnnotation);
+      if (listEl) listEl.innerHTML = '';
+      loadAnnotations();
+    }
+  }
+  if (window.EventSource && docEl.dataset.eventsUrl){
+    const es = new EventSource(docEl.dataset.eventsUrl);
+    ['annotation.created', 'annotation.deleted', 'comment.created', 'reset'].forEach(type =>
+      es.addEventListener(type, e => {
+        const d = JSON.parse(e.data);
+        if (listLoaded) applyEvent(type, d); else pendingEvents.push([type, d]);
+      }));
+  }
+  // A body fetched whole has no offsets until it arrives; lazily loaded sections
+  // carry data-offset, so their highlights are drawn as each section comes in
+  if (docEl.dataset.contentUrl && docEl.dataset.pendingSections !== '0')
+    document.addEventListener('doc:sections-ready', loadAnnotations, { once: true });
+  else
+    loadAnnotations();
+  document.addEventListener('doc:section-loaded', () => {
+    const waiting = [...DEFERRED.values()];
+    DEFERRED.clear();
+    waiting.forEach(args => highlightByNormalizedRange(...args));
+    cleanupDuplicateMarks();
+  });
 
   // ---- Selection & popover (create) ----
   if (typeof CAN_ANNOTATE !== "undefined" && CAN_ANNOTATE){
@@ -107,14 +170,14 @@
   }
 
   function openPopoverFor(sel){
-    const {start, end, anchor} = selectionNormalizedOffsets(docEl, sel);
+    const {start, end, anchor, prefix, suffix} = selectionNormalizedOffsets(docEl, sel);
     if (start === null) return;
     if (pop) pop.classList.remove('hidden');
     if (txt) txt.value = '';
 
     if (btnSave) btnSave.onclick = async () => {
       const note = (txt && txt.value ? txt.value : '').trim();
-      const body = {start, end, anchor, color: undefined, note};
+      const body = {start, end, anchor, prefix, suffix, color: undefined, note};
       try {
         const res = await fetch(`/api/documents/${DOC_ID}/annotations`, {
           method:'POST', headers:{'Content-Type':'application/json'},
@@ -122,10 +185,12 @@
         });
         const text = await res.text();
         if (!res.ok) throw new Error(text || 'HTTP error');
-        const {id} = JSON.parse(text);
+        // the server may have re-anchored the selection
+        const saved = JSON.parse(text), id = saved.id;
+        const s = saved.start ?? start, e = saved.end ?? end;
         const tooltip = note || anchor;
-        ensureSingleListItem({id, start, end, anchor, color:'yellow', user:'you', content: note, comments: note ? [{id:0, text:note, user:'you'}] : [], can_delete:true});
-        highlightByNormalizedRange(start, end, 'yellow', id, tooltip);
+        ensureSingleListItem({id, start: s, end: e, anchor, color:'yellow', user:'you', content: note, comments: note ? [{id:0, text:note, user:'you'}] : [], can_delete:true});
+        highlightByNormalizedRange(s, e, 'yellow', id, tooltip);
       } catch (e){
         alert('Could not save annotation: ' + e.message);
       } finally {
@@ -148,13 +213,7 @@
       try{
         const res = await fetch(`/api/annotations/${id}`, { method: 'DELETE' });
         if (!res.ok) throw new Error(await res.text());
-        const item = listEl.querySelector(`.item[data-id="${id}"]`);
-        if (item) item.remove();
-        document.querySelectorAll(`mark.ann[data-id="${id}"]`).forEach(mark => {
-          const p = mark.parentNode; while (mark.firstChild) p.insertBefore(mark.firstChild, mark); p.removeChild(mark);
-        });
-        RENDERED_IDS.delete(String(id));
-        document.dispatchEvent(new CustomEvent('annotations:updated'));
+        removeAnnotation(id);
       } catch (e){
         alert('Could not delete annotation: ' + e.message);
       }
@@ -206,13 +265,7 @@
         const res = await fetch(`/api/annotations/${id}`, { method: 'DELETE' });
         if (!res.ok) throw new Error(await res.text());
         viewPop.classList.add('hidden');
-        const item = listEl ? listEl.querySelector(`.item[data-id="${id}"]`) : null;
-        if (item) item.remove();
-        document.querySelectorAll(`mark.ann[data-id="${id}"]`).forEach(mark => {
-          const p = mark.parentNode; while (mark.firstChild) p.insertBefore(mark.firstChild, mark); p.removeChild(mark);
-        });
-        RENDERED_IDS.delete(String(id));
-        document.dispatchEvent(new CustomEvent('annotations:updated'));
+        removeAnnotation(id);
       } catch (e){
         alert('Could not delete annotation: ' + e.message);
       }
@@ -242,10 +295,27 @@
     return out.trim();
   }
 
+  // Sectioned documents: offsets of a section's text start at its data-offset, so
+  // only the sections a range touches need to be in the DOM. Returns the text nodes
+  // of sections [from, to] and their base offset, or null if one is still pending.
+  function sectionScope(from, to){
+    const sections = [...docEl.querySelectorAll('.doc-section[data-offset]')];
+    if (!sections.length) return {nodes: textNodes(docEl), base: 0};
+    const pick = typeof from === 'number'
+      ? off => sections.filter(el => +el.dataset.offset <= off).pop() || sections[0]
+      : node => (node.nodeType === 1 ? node : node.parentElement)?.closest('.doc-section') || sections[0];
+    const i = sections.indexOf(pick(from)), j = Math.max(i, sections.indexOf(pick(to)));
+    const span = sections.slice(i, j + 1);
+    if (span.some(el => el.hasAttribute('data-pending'))) return null;
+    return {nodes: span.flatMap(el => textNodes(el)), base: +sections[i].dataset.offset};
+  }
+
   function selectionNormalizedOffsets(root, sel){
-    const nodes = textNodes(root);
-    if (!nodes.length) return {start:null,end:null,anchor:""};
     const range = sel.getRangeAt(0);
+    const scope = root === docEl ? sectionScope(range.startContainer, range.endContainer)
+                                 : {nodes: textNodes(root), base: 0};
+    const nodes = scope ? scope.nodes : [];
+    if (!nodes.length) return {start:null,end:null,anchor:""};
     let seenNorm=0, startNorm=null, endNorm=null;
     for (const tn of nodes){
       const t = tn.nodeValue;
@@ -255,7 +325,9 @@
     }
     if (startNorm===null || endNorm===null || endNorm<=startNorm) return {start:null,end:null,anchor:""};
     const fullPlain = buildNormalizedPlain(nodes);
-    return { start:startNorm, end:endNorm, anchor: fullPlain.slice(startNorm, endNorm) };
+    // context lets the server pick the right occurrence if the offsets don't line up
+    return { start:scope.base + startNorm, end:scope.base + endNorm, anchor: fullPlain.slice(startNorm, endNorm),
+             prefix: fullPlain.slice(Math.max(0, startNorm - 64), startNorm), suffix: fullPlain.slice(endNorm, endNorm + 64) };
   }
 
   function seekRawPosForNorm(nodes, targetNorm){
@@ -289,9 +361,15 @@
     // Force yellow highlight unless overridden
     const bg = color || 'yellow';
 
-    const nodes = textNodes(docEl);
-    const a = seekRawPosForNorm(nodes, startNorm);
-    const b = seekRawPosForNorm(nodes, endNorm);
+    const scope = sectionScope(startNorm, Math.max(startNorm, endNorm - 1));
+    if (!scope){
+      DEFERRED.set(String(id), [startNorm, endNorm, color, id, tooltip]);
+      return;
+    }
+    const nodes = scope.nodes;
+    if (!nodes.length) return;
+    const a = seekRawPosForNorm(nodes, startNorm - scope.base);
+    const b = seekRawPosForNorm(nodes, endNorm - scope.base);
 
     const r = document.createRange();
     r.setStart(a.node, Math.min(a.offset, a.node.nodeValue.length));
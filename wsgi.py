@@ -0,0 +1,7 @@
+# Production entry point, e.g. `gunicorn -w 4 -b 0.0.0.0:8000 wsgi:app`.
+# Schema changes go through `flask db upgrade`, not the run.py bootstrap.
+from app import create_app
+from services import startup
+
+app = create_app("prod")
+startup.warm_up(app)  # recent documents' caches, in a background thread